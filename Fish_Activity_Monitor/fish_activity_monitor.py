@@ -19,17 +19,42 @@ Features:
 
 import cv2
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 import json
+import math
 import time
 import threading
 import logging
+import queue
 from datetime import datetime
 import paho.mqtt.client as mqtt
 import sqlite3
 import os
+import random
 import signal
+import socket
 import sys
+import uuid
+from collections import deque
+from itertools import islice
 import requests
+from requests.adapters import HTTPAdapter
+
+# Optional accelerators; the module falls back to the stdlib / NumPy without them
+try:
+    import orjson
+    dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    _json_encoder = json.JSONEncoder(separators=(',', ':'))
+    
+    def dumps(obj):
+        return _json_encoder.encode(obj).encode()
+
+try:
+    import numba  # JIT-compiles the per-track movement kernel
+except ImportError:
+    numba = None
 
 # Configuration
 class Config:
@@ -43,6 +68,8 @@ class Config:
         self.max_contour_area = 50000
         self.tracking_history = 30
         self.measurement_interval = 30  # seconds
+        self.measurement_window = 5  # seconds of frames analysed before each measurement
+        self.warmup_frames = 5  # frames that only retrain the background when a window opens
         self.dummy_mode = False
         self.mqtt_broker = "your_mqtt_broker"
         self.mqtt_port = 8883
@@ -54,6 +81,13 @@ class Config:
         self.api_port = 3000
         self.api_endpoint = "/api/fish-activity-readings"
         self.pool_id = 1
+        self.api_batch_size = 1  # readings queued before a flush
+        self.api_flush_interval = 60  # seconds
+        self.api_max_failures = 5  # consecutive failures before the circuit opens
+        self.api_circuit_cooldown = 300  # seconds
+        self.publish_log_interval = 60  # seconds between "Data published" log lines
+        self.db_commit_batch = 10  # inserts per commit
+        self.db_commit_interval = 300  # seconds
 
 config = Config()
 
@@ -65,6 +99,47 @@ fish_tracks = []
 activity_buffer = []
 last_measurement = 0
 
+# Persistent database connection and pending (uncommitted) insert count
+db_conn = None
+db_pending = 0
+last_db_commit = 0
+
+INSERT_SQL = '''
+    INSERT INTO activity_data 
+    (timestamp, activity_level, active_fish_count, total_fish_count, average_movement, quality_score)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Single-slot frame buffer filled by the grabber thread (newest frame wins)
+latest_frame = None
+frame_count = 0
+frame_lock = threading.Lock()
+frame_ready = threading.Event()
+decode_frames = threading.Event()  # set while frames are needed for a measurement
+
+# Completed readings waiting for the sink worker (MQTT, database, API)
+sink_queue = queue.Queue(maxsize=16)
+sink_thread = None
+last_publish_log = 0.0
+
+# Static payload fields, copied into every outgoing message
+MQTT_TEMPLATE = {'sensor_id': 'fish_activity_001'}
+API_TEMPLATE = {"notes": "Automated reading from fish activity monitor"}
+
+# API client state: one pooled keep-alive session and a queue of unsent readings
+api_session = requests.Session()
+api_session.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=0  # flush_api owns retries, backoff and the circuit breaker
+))
+api_session.headers.update({'Content-Type': 'application/json'})
+api_pending = deque(maxlen=100)
+api_batch_supported = True
+last_api_flush = 0
+api_failures = 0
+api_retry_at = 0.0  # no sends before this time (backoff / open circuit)
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -76,157 +151,251 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Elliptical structuring element gives rounder blobs than a square kernel
+_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+
+def cuda_available():
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
 class FishTracker:
+    TRACK_ARRAYS = ('track_id', 'track_xy', 'track_dis', 'track_hist', 'track_hlen')
+    
     def __init__(self):
-        self.background_subtractor = cv2.createBackgroundSubtractorMOG2(
-            history=500, varThreshold=16, detectShadows=True
-        )
-        self.kernel = np.ones((5, 5), np.uint8)
-        self.tracks = []
+        # Prefer CUDA, then OpenCL via the transparent API (UMat), then plain CPU
+        self.use_cuda = cuda_available()
+        self.use_opencl = not self.use_cuda and cv2.ocl.haveOpenCL()
+        
+        if self.use_cuda:
+            self.background_subtractor = cv2.cuda.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=16, detectShadows=False
+            )
+            self.morph_filter = cv2.cuda.createMorphologyFilter(cv2.MORPH_OPEN, cv2.CV_8UC1, _KERNEL)
+            self.gpu_frame = cv2.cuda_GpuMat()
+            self.stream = cv2.cuda_Stream()
+            logger.info("FishTracker using CUDA")
+        else:
+            self.background_subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=16, detectShadows=False
+            )
+            if self.use_opencl:
+                cv2.ocl.setUseOpenCL(True)
+                logger.info("FishTracker using OpenCL")
+        
+        self.scale = 0.5  # Frame downscale factor applied before segmentation
+        # Tracks are stored as parallel arrays, one row per track; rows past
+        # n_tracks are spare capacity
+        capacity = 16
+        self.n_tracks = 0
+        self.track_id = np.empty(capacity, dtype=np.int64)
+        self.track_xy = np.empty((capacity, 2), dtype=np.float32)
+        self.track_dis = np.empty(capacity, dtype=np.int32)
+        self.track_hist = np.empty((capacity, config.tracking_history, 2), dtype=np.int16)
+        self.track_hlen = np.empty(capacity, dtype=np.int64)
         self.next_id = 0
         self.max_disappeared = 30
+        self.learning_rate = -1  # MOG2 learning rate for the next frame; -1 is automatic
+        
+    def reset(self):
+        """Drop all tracks and re-seed the background model from the next frame,
+        for when the scene has moved on since the last frame seen"""
+        self.n_tracks = 0
+        self.learning_rate = 1  # a rate of 1 makes MOG2 reinitialise
+        
+    def learn_background(self, frame):
+        """Feed a frame to the background model only, without tracking"""
+        self.foreground(frame)
+        
+    def foreground(self, frame):
+        rate, self.learning_rate = self.learning_rate, -1
+        if self.use_cuda:
+            return self.segment_cuda(frame, rate)
+        return self.segment(cv2.UMat(frame) if self.use_opencl else frame, rate)
         
     def update(self, frame):
-        # Apply background subtraction
-        fg_mask = self.background_subtractor.apply(frame)
-        
-        # Morphological operations to clean up the mask
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, self.kernel)
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, self.kernel)
-        
-        # Find contours
-        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Filter contours by area
-        valid_contours = []
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if config.min_contour_area < area < config.max_contour_area:
-                valid_contours.append(contour)
-        
-        # Get centroids
-        centroids = []
-        for contour in valid_contours:
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-                centroids.append((cx, cy))
+        fg_mask = self.foreground(frame)
+        
+        # Label blobs and get their areas and centroids in a single pass
+        _, _, stats, blob_centroids = cv2.connectedComponentsWithStats(fg_mask, connectivity=8)
+        
+        # Filter blobs by area (limits are in full-resolution pixels); label 0 is background
+        area_scale = self.scale ** 2
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        valid = (areas > config.min_contour_area * area_scale) & (areas < config.max_contour_area * area_scale)
+        
+        # Map centroids back to full-resolution coordinates
+        centroids = (blob_centroids[1:][valid] / self.scale).astype(int)
         
         # Update tracks
         self.update_tracks(centroids)
         
-        return fg_mask, valid_contours
+        return fg_mask, stats[1:][valid]
+    
+    def segment(self, frame, learning_rate=-1):
+        # Work on a downscaled frame; blob geometry survives and MOG2 touches fewer pixels
+        small = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        
+        # Colour adds nothing to fish/background separation, so model a single channel
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        
+        # Apply background subtraction
+        fg_mask = self.background_subtractor.apply(gray, learningRate=learning_rate)
+        
+        # Remove speckle noise; with shadows disabled there are no gaps that need closing
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, _KERNEL)
+        
+        return fg_mask.get() if isinstance(fg_mask, cv2.UMat) else fg_mask
+    
+    def segment_cuda(self, frame, learning_rate=-1):
+        # Same pipeline as segment(), kept on the device until the final mask
+        self.gpu_frame.upload(frame, self.stream)
+        small = cv2.cuda.resize(self.gpu_frame, (0, 0), fx=self.scale, fy=self.scale,
+                                interpolation=cv2.INTER_AREA, stream=self.stream)
+        gray = cv2.cuda.cvtColor(small, cv2.COLOR_BGR2GRAY, stream=self.stream)
+        fg_mask = self.background_subtractor.apply(gray, learning_rate, self.stream)
+        fg_mask = self.morph_filter.apply(fg_mask, stream=self.stream)
+        self.stream.waitForCompletion()
+        
+        return fg_mask.download()
     
     def update_tracks(self, centroids):
-        if len(centroids) == 0:
-            # Mark all tracks as disappeared
-            for track in self.tracks:
-                track['disappeared'] += 1
-            
-            # Remove tracks that have disappeared too long
-            self.tracks = [track for track in self.tracks if track['disappeared'] < self.max_disappeared]
-            return
+        points = np.asarray(centroids, dtype=np.float32).reshape(-1, 2)
+        n = self.n_tracks
+        history_len = self.track_hist.shape[1]
         
-        if len(self.tracks) == 0:
-            # Create new tracks for all centroids
-            for centroid in centroids:
-                self.tracks.append({
-                    'id': self.next_id,
-                    'centroid': centroid,
-                    'disappeared': 0,
-                    'history': [centroid]
-                })
-                self.next_id += 1
-            return
+        matched = np.zeros(n, dtype=bool)
+        used = np.zeros(len(points), dtype=bool)
         
-        # Calculate distances between existing tracks and new centroids
-        distances = np.zeros((len(self.tracks), len(centroids)))
-        for i, track in enumerate(self.tracks):
-            for j, centroid in enumerate(centroids):
-                distances[i, j] = np.linalg.norm(np.array(track['centroid']) - np.array(centroid))
-        
-        # Assign centroids to tracks using Hungarian algorithm (simplified)
-        used_centroids = set()
-        for i in range(len(self.tracks)):
-            if len(used_centroids) >= len(centroids):
-                break
+        if n > 0 and len(points) > 0:
+            # Calculate distances between existing tracks and new centroids in one broadcast
+            distances = np.sqrt(((self.track_xy[:n, None, :] - points[None, :, :]) ** 2).sum(-1))
             
-            min_distance = float('inf')
-            min_j = -1
+            # Assign centroids to tracks using the Hungarian algorithm. Pairs beyond
+            # the max distance threshold get a prohibitive (finite) cost so the
+            # solver never prefers them, and are rejected afterwards.
+            max_distance = 100
+            cost = np.where(distances < max_distance, distances, 1e6)
+            rows, cols = linear_sum_assignment(cost)
+            close = distances[rows, cols] < max_distance
+            rows, cols = rows[close], cols[close]
             
-            for j in range(len(centroids)):
-                if j not in used_centroids and distances[i, j] < min_distance:
-                    min_distance = distances[i, j]
-                    min_j = j
+            # Scatter matched centroids into their tracks and history ring buffers
+            self.track_xy[rows] = points[cols]
+            self.track_dis[rows] = 0
+            self.track_hist[rows, self.track_hlen[rows] % history_len] = points[cols]
+            self.track_hlen[rows] += 1
             
-            if min_j != -1 and min_distance < 100:  # Max distance threshold
-                self.tracks[i]['centroid'] = centroids[min_j]
-                self.tracks[i]['disappeared'] = 0
-                self.tracks[i]['history'].append(centroids[min_j])
-                
-                # Limit history length
-                if len(self.tracks[i]['history']) > config.tracking_history:
-                    self.tracks[i]['history'].pop(0)
-                
-                used_centroids.add(min_j)
-            else:
-                self.tracks[i]['disappeared'] += 1
+            matched[rows] = True
+            used[cols] = True
+        
+        # Unmatched tracks have disappeared for this frame
+        self.track_dis[:n][~matched] += 1
         
         # Create new tracks for unmatched centroids
-        for j, centroid in enumerate(centroids):
-            if j not in used_centroids:
-                self.tracks.append({
-                    'id': self.next_id,
-                    'centroid': centroid,
-                    'disappeared': 0,
-                    'history': [centroid]
-                })
-                self.next_id += 1
-        
-        # Remove disappeared tracks
-        self.tracks = [track for track in self.tracks if track['disappeared'] < self.max_disappeared]
+        self.add_tracks(points[~used])
+        
+        # Remove tracks that have disappeared too long
+        keep = self.track_dis[:self.n_tracks] < self.max_disappeared
+        if not keep.all():
+            kept = int(keep.sum())
+            for name in self.TRACK_ARRAYS:
+                array = getattr(self, name)
+                array[:kept] = np.compress(keep, array[:self.n_tracks], axis=0)
+            self.n_tracks = kept
+    
+    def add_tracks(self, points):
+        count = len(points)
+        if count == 0:
+            return
+        
+        start = self.n_tracks
+        self.reserve(start + count)
+        new = slice(start, start + count)
+        
+        self.track_id[new] = np.arange(self.next_id, self.next_id + count)
+        self.track_xy[new] = points
+        self.track_dis[new] = 0
+        self.track_hist[new, 0] = points
+        self.track_hlen[new] = 1
+        
+        self.next_id += count
+        self.n_tracks += count
+    
+    def reserve(self, size):
+        capacity = len(self.track_id)
+        if size <= capacity:
+            return
+        
+        # Grow every track array together (doubling) so rows stay aligned
+        capacity = max(size, 2 * capacity)
+        for name in self.TRACK_ARRAYS:
+            array = getattr(self, name)
+            grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.n_tracks] = array[:self.n_tracks]
+            setattr(self, name, grown)
+
+def _track_movement_numpy(hist, hlen, depth):
+    """Path length of each track over its last `depth` positions"""
+    history_len = hist.shape[1]
+    count = np.minimum(np.minimum(hlen, history_len), depth)
+    
+    # Gather each track's last `depth` ring-buffer slots, oldest first; slots
+    # before the start of a short history are masked out of the sum
+    offsets = np.arange(depth)
+    slots = (hlen[:, None] - depth + offsets) % history_len
+    recent = hist[np.arange(len(hist))[:, None], slots].astype(np.float32)
+    segments = np.diff(recent, axis=1)
+    valid = offsets[:-1] >= (depth - count)[:, None]
+    return (np.hypot(segments[..., 0], segments[..., 1]) * valid).sum(axis=1)
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _track_movement_jit(hist, hlen, depth):
+        n, history_len = hist.shape[0], hist.shape[1]
+        movement = np.zeros(n)
+        for i in numba.prange(n):
+            count = min(hlen[i], history_len, depth)
+            total = 0.0
+            for k in range(hlen[i] - count, hlen[i] - 1):
+                a = k % history_len
+                b = (k + 1) % history_len
+                dx = float(hist[i, b, 0]) - float(hist[i, a, 0])
+                dy = float(hist[i, b, 1]) - float(hist[i, a, 1])
+                total += math.sqrt(dx * dx + dy * dy)
+            movement[i] = total
+        return movement
+    
+    track_movement = _track_movement_jit
+else:
+    track_movement = _track_movement_numpy
 
 class ActivityAnalyzer:
     def __init__(self):
-        self.movement_buffer = []
         self.buffer_size = 100
+        self.movement_buffer = deque(maxlen=self.buffer_size)
         
-    def analyze_activity(self, tracks):
+    def analyze_activity(self, hist, hlen):
         current_time = time.time()
         
-        # Calculate movement for each track
-        total_movement = 0
-        active_fish = 0
-        
-        for track in tracks:
-            if len(track['history']) > 1:
-                # Calculate movement over last few positions
-                movement = 0
-                for i in range(1, min(len(track['history']), 10)):
-                    p1 = np.array(track['history'][-i-1])
-                    p2 = np.array(track['history'][-i])
-                    movement += np.linalg.norm(p2 - p1)
-                
-                total_movement += movement
-                if movement > 10:  # Threshold for active fish
-                    active_fish += 1
+        # Calculate movement for each track over its last few positions
+        movement = track_movement(hist, hlen, 10)
+        
+        total_movement = float(movement.sum())
+        active_fish = int((movement > 10).sum())  # Threshold for active fish
         
         # Store movement data
         self.movement_buffer.append({
             'timestamp': current_time,
             'total_movement': total_movement,
             'active_fish': active_fish,
-            'total_fish': len(tracks)
+            'total_fish': len(hist)
         })
         
-        # Limit buffer size
-        if len(self.movement_buffer) > self.buffer_size:
-            self.movement_buffer.pop(0)
-        
         # Calculate activity metrics
         if len(self.movement_buffer) > 0:
-            recent_data = self.movement_buffer[-min(10, len(self.movement_buffer)):]
+            recent_data = list(islice(self.movement_buffer, max(0, len(self.movement_buffer) - 10), None))
             
             avg_movement = sum(d['total_movement'] for d in recent_data) / len(recent_data)
             avg_active_fish = sum(d['active_fish'] for d in recent_data) / len(recent_data)
@@ -248,7 +417,14 @@ def setup_mqtt():
     global mqtt_client
     
     def on_connect(client, userdata, flags, rc):
-        logger.info(f"Connected to MQTT broker with result code {rc}")
+        logger.info("Connected to MQTT broker with result code %s", rc)
+        
+        # Small telemetry publishes shouldn't wait on Nagle's algorithm
+        try:
+            client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception as e:
+            logger.warning(f"Could not set TCP_NODELAY on MQTT socket: {e}")
+        
         client.subscribe("aquatic/fish_activity/config")
         client.subscribe("aquatic/fish_activity/control")
     
@@ -285,6 +461,10 @@ def setup_mqtt():
     mqtt_client.on_connect = on_connect
     mqtt_client.on_message = on_message
     
+    # Let paho's network loop absorb bursts from the sink worker
+    mqtt_client.max_inflight_messages_set(20)
+    mqtt_client.max_queued_messages_set(1000)
+    
     try:
         mqtt_client.connect(config.mqtt_broker, config.mqtt_port, 60)
         mqtt_client.loop_start()
@@ -300,6 +480,7 @@ def setup_camera():
         camera.set(cv2.CAP_PROP_FRAME_WIDTH, config.frame_width)
         camera.set(cv2.CAP_PROP_FRAME_HEIGHT, config.frame_height)
         camera.set(cv2.CAP_PROP_FPS, config.fps)
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Don't let the driver queue stale frames
         
         if not camera.isOpened():
             raise Exception("Could not open camera")
@@ -312,11 +493,14 @@ def setup_camera():
         return False
 
 def setup_database():
+    global db_conn, last_db_commit
+    
     try:
-        conn = sqlite3.connect('fish_activity.db', check_same_thread=False)
-        cursor = conn.cursor()
+        db_conn = sqlite3.connect('fish_activity.db', check_same_thread=False)
+        db_conn.execute("PRAGMA journal_mode=WAL")
+        db_conn.execute("PRAGMA synchronous=NORMAL")
         
-        cursor.execute('''
+        db_conn.execute('''
             CREATE TABLE IF NOT EXISTS activity_data (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 timestamp REAL,
@@ -328,15 +512,46 @@ def setup_database():
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # Readings that could not be delivered to the API, replayed on recovery
+        db_conn.execute('''
+            CREATE TABLE IF NOT EXISTS api_outbox (
+                reading_id TEXT PRIMARY KEY,
+                created REAL,
+                payload BLOB
+            )
+        ''')
+        
+        db_conn.commit()
+        last_db_commit = time.time()
         logger.info("Database initialized")
         
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
 
 def publish_data(data):
-    global mqtt_client
+    """Hand a reading to the sink worker without blocking the capture loop"""
+    try:
+        sink_queue.put_nowait(data)
+    except queue.Full:
+        # Drop the oldest reading; keeping the capture loop live matters more
+        try:
+            sink_queue.get_nowait()
+        except queue.Empty:
+            pass
+        sink_queue.put_nowait(data)
+
+def sink_worker():
+    """Deliver queued readings to MQTT, the database and the API"""
+    while running or not sink_queue.empty():
+        try:
+            data = sink_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        
+        deliver_data(data)
+
+def deliver_data(data):
+    global mqtt_client, last_publish_log
     
     if mqtt_client is None:
         return
@@ -344,18 +559,14 @@ def publish_data(data):
     try:
         # Add sensor metadata
         mqtt_data = {
-            'sensor_id': 'fish_activity_001',
-            'timestamp': data['timestamp'],
-            'activity_level': data['activity_level'],
-            'active_fish_count': data['active_fish_count'],
-            'total_fish_count': data['total_fish_count'],
-            'average_movement': data['average_movement'],
+            **MQTT_TEMPLATE,
+            **data,
             'quality_score': calculate_quality_score(data),
             'dummy_mode': config.dummy_mode
         }
         
         # Publish to MQTT
-        mqtt_client.publish("aquatic/fish_activity/data", json.dumps(mqtt_data))
+        mqtt_client.publish("aquatic/fish_activity/data", dumps(mqtt_data))
         
         # Store in database
         store_data(mqtt_data)
@@ -363,50 +574,166 @@ def publish_data(data):
         # Send to API
         send_to_api(data)
         
-        logger.info(f"Data published: Activity={data['activity_level']:.1f}%, Fish={data['total_fish_count']}")
+        # Rate-limit the routine INFO line; formatting is deferred to the logger
+        if time.time() - last_publish_log >= config.publish_log_interval:
+            logger.info("Data published: Activity=%.1f%%, Fish=%d",
+                        data['activity_level'], data['total_fish_count'])
+            last_publish_log = time.time()
         
     except Exception as e:
         logger.error(f"Failed to publish data: {e}")
 
 def send_to_api(data):
-    """Send data to the API endpoint"""
+    """Queue data for the API endpoint and flush when a batch is due"""
+    # Prepare API payload according to the API documentation
+    api_pending.append({
+        **API_TEMPLATE,
+        "reading_id": str(uuid.uuid4()),  # lets the server de-duplicate replays
+        "pool_id": config.pool_id,
+        "activity_level": data['activity_level'],
+        "movement_count": data['total_fish_count'],  # Using total fish count as movement count
+        "average_speed": data['average_movement']
+    })
+    
+    if (len(api_pending) >= config.api_batch_size
+            or time.time() - last_api_flush >= config.api_flush_interval):
+        flush_api()
+
+def flush_api():
+    """Send pending readings to the API, backing off while it is failing"""
+    global last_api_flush, api_failures, api_retry_at
+    
+    current_time = time.time()
+    if current_time < api_retry_at:
+        # Backing off or circuit open: park readings in the outbox without sending
+        if spool_readings(list(api_pending)):
+            api_pending.clear()
+        return
+    
+    last_api_flush = current_time
+    readings = list(api_pending)
+    api_pending.clear()
+    
+    sent = 0
     try:
-        api_url = f"http://{config.api_server}:{config.api_port}{config.api_endpoint}"
-        
-        # Prepare API payload according to the API documentation
-        api_payload = {
-            "pool_id": config.pool_id,
-            "activity_level": data['activity_level'],
-            "movement_count": data['total_fish_count'],  # Using total fish count as movement count
-            "average_speed": data['average_movement'],
-            "notes": "Automated reading from fish activity monitor"
-        }
+        sent = post_readings(readings)
+    except Exception as e:
+        logger.error(f"Failed to send data to API: {e}")
+    
+    if sent == len(readings):
+        api_failures = 0
+        api_retry_at = 0.0
+        replay_outbox()
+        return
+    
+    if not spool_readings(readings[sent:]):
+        api_pending.extendleft(reversed(readings[sent:]))
+    
+    record_api_failure()
+
+def record_api_failure():
+    """Count a failed send and schedule the next attempt"""
+    global api_failures, api_retry_at
+    
+    # Exponential backoff with jitter; open the circuit after repeated failures
+    api_failures += 1
+    if api_failures >= config.api_max_failures:
+        delay = config.api_circuit_cooldown
+        logger.warning(f"API failing, pausing sends for {delay}s")
+    else:
+        delay = min(60, 0.5 * 2 ** api_failures) + random.random() * 0.1
+    api_retry_at = time.time() + delay
+
+def post_readings(readings):
+    """POST readings to the API, as a single batch when there is more than one.
+    Returns how many readings (from the front of the list) were accepted."""
+    global api_batch_supported
+    
+    api_url = f"http://{config.api_server}:{config.api_port}{config.api_endpoint}"
+    
+    if len(readings) > 1 and api_batch_supported:
+        response = api_session.post(f"{api_url}/batch", data=dumps(readings), timeout=10)
         
-        response = requests.post(
-            api_url,
-            json=api_payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
+        if response.status_code in [200, 201]:
+            logger.info("API Success: %d (%d readings)", response.status_code, len(readings))
+            return len(readings)
+        elif response.status_code == 404:
+            logger.warning("API batch endpoint not available, sending readings individually")
+            api_batch_supported = False
+        else:
+            logger.error(f"API Error: {response.status_code} - {response.text}")
+            return 0
+    
+    for sent, reading in enumerate(readings):
+        response = api_session.post(api_url, data=dumps(reading), timeout=10)
         
         if response.status_code in [200, 201]:
-            logger.info(f"API Success: {response.status_code}")
+            logger.debug("API Success: %d", response.status_code)
         else:
             logger.error(f"API Error: {response.status_code} - {response.text}")
-            
+            return sent
+    
+    return len(readings)
+
+def spool_readings(readings):
+    """Persist unsent readings to the outbox table; returns False if they could not be stored"""
+    if not readings:
+        return True
+    if db_conn is None:
+        return False
+    
+    try:
+        db_conn.executemany(
+            "INSERT OR IGNORE INTO api_outbox (reading_id, created, payload) VALUES (?, ?, ?)",
+            [(r['reading_id'], time.time(), dumps(r)) for r in readings]
+        )
+        commit_data()
+        return True
     except Exception as e:
-        logger.error(f"Failed to send data to API: {e}")
+        logger.error(f"Failed to spool API readings: {e}")
+        return False
+
+def replay_outbox(limit=100):
+    """Resend readings spooled while the API was unavailable"""
+    # Nothing is replayed while backing off or with the circuit open
+    if db_conn is None or time.time() < api_retry_at:
+        return
+    
+    rows, sent = [], 0
+    try:
+        rows = db_conn.execute(
+            "SELECT reading_id, payload FROM api_outbox ORDER BY created LIMIT ?", (limit,)
+        ).fetchall()
+        if not rows:
+            return
+        
+        sent = post_readings([json.loads(payload) for _, payload in rows])
+        db_conn.executemany(
+            "DELETE FROM api_outbox WHERE reading_id = ?",
+            [(reading_id,) for reading_id, _ in rows[:sent]]
+        )
+        commit_data()
+        
+        if sent:
+            logger.info(f"Replayed {sent} spooled API readings")
+        
+    except Exception as e:
+        logger.error(f"Failed to replay API outbox: {e}")
+        if sent:
+            return  # Sent fine; only the local delete failed
+    
+    # A failed replay counts against the API like a failed flush
+    if sent < len(rows):
+        record_api_failure()
 
 def store_data(data):
+    global db_pending
+    
+    if db_conn is None:
+        return
+    
     try:
-        conn = sqlite3.connect('fish_activity.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO activity_data 
-            (timestamp, activity_level, active_fish_count, total_fish_count, average_movement, quality_score)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
+        db_conn.execute(INSERT_SQL, (
             data['timestamp'],
             data['activity_level'],
             data['active_fish_count'],
@@ -414,13 +741,23 @@ def store_data(data):
             data['average_movement'],
             data['quality_score']
         ))
+        db_pending += 1
         
-        conn.commit()
-        conn.close()
+        # Group inserts into one transaction instead of syncing every row
+        if (db_pending >= config.db_commit_batch
+                or time.time() - last_db_commit >= config.db_commit_interval):
+            commit_data()
         
     except Exception as e:
         logger.error(f"Failed to store data: {e}")
 
+def commit_data():
+    global db_pending, last_db_commit
+    
+    db_conn.commit()
+    db_pending = 0
+    last_db_commit = time.time()
+
 def calculate_quality_score(data):
     score = 100
     
@@ -438,17 +775,55 @@ def calculate_quality_score(data):
     
     return max(0, score)
 
+# Dummy readings are drawn from pre-generated batches: columns are activity level,
+# active fish, total fish and average movement
+_RNG = np.random.default_rng()
+_DUMMY_SCALE = np.array([70, 8, 8, 250])
+_DUMMY_OFFSET = np.array([10, 1, 5, 50])
+_dummy_batch = None
+_dummy_index = 0
+
 def generate_dummy_data():
-    import random
+    global _dummy_batch, _dummy_index
+    
+    if _dummy_batch is None or _dummy_index >= len(_dummy_batch):
+        _dummy_batch = _RNG.uniform(size=(1024, 4)) * _DUMMY_SCALE + _DUMMY_OFFSET
+        _dummy_index = 0
+    
+    activity_level, active_fish, total_fish, movement = _dummy_batch[_dummy_index]
+    _dummy_index += 1
     
     return {
-        'activity_level': random.uniform(10, 80),
-        'active_fish_count': random.randint(1, 8),
-        'total_fish_count': random.randint(5, 12),
-        'average_movement': random.uniform(50, 300),
+        'activity_level': float(activity_level),
+        'active_fish_count': int(active_fish),
+        'total_fish_count': int(total_fish),
+        'average_movement': float(movement),
         'timestamp': time.time()
     }
 
+def grab_frames():
+    """Continuously read the camera, keeping only the newest frame"""
+    global latest_frame, frame_count
+    
+    while running:
+        if not decode_frames.is_set():
+            # Outside the measurement window: keep the driver buffer drained without decoding
+            if not camera.grab():
+                logger.error("Failed to grab frame from camera")
+                time.sleep(1)
+            continue
+        
+        ret, frame = camera.read()
+        if not ret:
+            logger.error("Failed to read frame from camera")
+            time.sleep(1)
+            continue
+        
+        with frame_lock:
+            latest_frame = frame
+            frame_count += 1
+        frame_ready.set()
+
 def main_loop():
     global running, last_measurement
     
@@ -456,9 +831,13 @@ def main_loop():
         if not setup_camera():
             logger.error("Failed to initialize camera, switching to dummy mode")
             config.dummy_mode = True
+        else:
+            threading.Thread(target=grab_frames, daemon=True).start()
     
     tracker = FishTracker()
     analyzer = ActivityAnalyzer()
+    processed_count = 0
+    warmup = 0
     
     logger.info("Fish Activity Monitor started")
     
@@ -476,18 +855,42 @@ def main_loop():
                 time.sleep(1)
                 continue
             
-            # Read frame from camera
-            ret, frame = camera.read()
-            if not ret:
-                logger.error("Failed to read frame from camera")
-                time.sleep(1)
+            # Only decode and analyse frames in the window leading up to a measurement
+            window_start = last_measurement + config.measurement_interval - config.measurement_window
+            if current_time < window_start:
+                decode_frames.clear()
+                time.sleep(min(window_start - current_time, 1))
+                continue
+            if not decode_frames.is_set():
+                # The scene has moved on since the last window; start tracking afresh
+                tracker.reset()
+                warmup = config.warmup_frames
+                decode_frames.set()
+            
+            # Wait for the grabber to deliver a frame we haven't processed yet
+            if not frame_ready.wait(timeout=1):
+                continue
+            frame_ready.clear()
+            
+            with frame_lock:
+                frame, count = latest_frame, frame_count
+            if count == processed_count:
+                continue
+            processed_count = count
+            
+            # Let the re-seeded background settle before any tracks are formed
+            if warmup:
+                tracker.learn_background(frame)
+                warmup -= 1
                 continue
             
             # Process frame
-            fg_mask, contours = tracker.update(frame)
+            fg_mask, blobs = tracker.update(frame)
             
             # Analyze activity
-            activity_data = analyzer.analyze_activity(tracker.tracks)
+            activity_data = analyzer.analyze_activity(
+                tracker.track_hist[:tracker.n_tracks], tracker.track_hlen[:tracker.n_tracks]
+            )
             
             # Publish data periodically
             if activity_data and current_time - last_measurement >= config.measurement_interval:
@@ -499,8 +902,6 @@ def main_loop():
             # if cv2.waitKey(1) & 0xFF == ord('q'):
             #     break
             
-            time.sleep(0.1)  # Small delay to prevent CPU overload
-            
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received")
             break
@@ -509,11 +910,15 @@ def main_loop():
             time.sleep(1)
 
 def cleanup():
-    global running, camera, mqtt_client
+    global running, camera, mqtt_client, db_conn
     
     logger.info("Cleaning up...")
     running = False
     
+    # Let the sink worker drain queued readings before closing its sinks
+    if sink_thread:
+        sink_thread.join(timeout=15)
+    
     if camera:
         camera.release()
     
@@ -521,6 +926,14 @@ def cleanup():
         mqtt_client.loop_stop()
         mqtt_client.disconnect()
     
+    if db_conn:
+        try:
+            commit_data()
+            db_conn.close()
+        except Exception as e:
+            logger.error(f"Failed to close database: {e}")
+        db_conn = None
+    
     cv2.destroyAllWindows()
     logger.info("Cleanup completed")
 
@@ -539,6 +952,9 @@ if __name__ == "__main__":
         setup_database()
         setup_mqtt()
         
+        sink_thread = threading.Thread(target=sink_worker, daemon=True)
+        sink_thread.start()
+        
         # Start main loop
         main_loop()
         
@@ -32,20 +32,65 @@ import time
 import json
 import logging
 import threading
-import queue
-from datetime import datetime, timedelta
+from datetime import datetime
 import paho.mqtt.client as mqtt
 import RPi.GPIO as GPIO
 from picamera2 import Picamera2
-import math
 import os
 import sqlite3
 from collections import deque
+from dataclasses import dataclass, fields
+from itertools import islice
 import yaml
 import argparse
 import signal
-import sys
+import queue
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import pigpio
+except ImportError:
+    pigpio = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    from tflite_runtime.interpreter import Interpreter, load_delegate
+except ImportError:
+    Interpreter = None
+
+# JSON encoding for MQTT and API payloads; orjson when installed, otherwise the stdlib
+# emitting the same compact bytes
+try:
+    import orjson
+    
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    
+    _loads = orjson.loads
+except ImportError:
+    def _json_default(obj):
+        if isinstance(obj, (np.generic, np.ndarray)):
+            return obj.tolist()
+        if hasattr(obj, '__dataclass_fields__'):
+            return {f.name: getattr(obj, f.name) for f in fields(obj)}
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    
+    _json_encoder = json.JSONEncoder(separators=(',', ':'), default=_json_default)
+    
+    def _dumps(obj):
+        return _json_encoder.encode(obj).encode()
+    
+    _loads = json.loads
 
 # Constants
 DEVICE_ID = "fish_feeding_monitor_01"
@@ -54,12 +99,24 @@ MQTT_BROKER = "your-mqtt-broker.com"
 MQTT_PORT = 1883
 MQTT_USERNAME = "aquatic_user"
 MQTT_PASSWORD = "secure_password"
+EVENT_FLUSH_INTERVAL = 0.5  # Seconds between batched feeding event publishes
+REALTIME_BATCH_SIZE = 16    # Real-time results per MQTT message...
+REALTIME_BATCH_INTERVAL = 0.25  # ...or seconds since the last flush, whichever comes first
 
 # API Configuration
 API_SERVER = "your-api-server.com"
 API_PORT = 3000
 API_ENDPOINT = "/api/fish-feeding-readings"
 POOL_ID = "pool_001"
+API_QUEUE_SIZE = 256    # Pending API payloads; the oldest is dropped when full
+API_BATCH_SIZE = 32     # Payloads per batch POST...
+API_BATCH_WAIT = 0.25   # ...or seconds to wait for more after the first, whichever comes first
+API_STOP_TIMEOUT = 10   # Seconds shutdown waits for room in a full API queue
+
+# Pooled keep-alive connections shared by every API request
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
 # GPIO Pin definitions
 SERVO_PIN = 18          # Servo motor for feeding mechanism
@@ -67,20 +124,37 @@ IR_LED_PIN = 24         # IR LED array control
 MOTION_SENSOR_PIN = 23  # PIR motion sensor
 STATUS_LED_PIN = 25     # Status LED
 
+# Servo pulse widths (microseconds, 50 Hz frame)
+SERVO_PERIOD_US = 20000
+SERVO_OPEN_US = 1500    # 90 degrees, dispensing
+SERVO_CLOSED_US = 500   # 0 degrees
+
 # Camera settings
 CAMERA_WIDTH = 1920
 CAMERA_HEIGHT = 1080
 CAMERA_FPS = 30
 EXPOSURE_TIME = 10000   # Microseconds
+DETECT_WIDTH = 416      # Motion and contour fish detection run on frames downscaled to this width
 
 # Detection parameters
 FISH_CONFIDENCE_THRESHOLD = 0.5
 FOOD_CONFIDENCE_THRESHOLD = 0.3
-MOTION_THRESHOLD = 30
+FISH_CLASS_IDS = [0]       # YOLO classes counted as fish (class 0 of a fish-trained model)
+MOTION_THRESHOLD = 30      # Foreground pixels (half-scale ROI) below which detection is skipped
 MAX_STRIKE_DISTANCE = 100  # Pixels
 MIN_STRIKE_DURATION = 0.1  # Seconds
 MAX_STRIKE_DURATION = 2.0  # Seconds
 
+# Brown/tan food pellet colour range (HSV); adjust based on food type
+FOOD_HSV_LOWER = np.array([10, 50, 50])
+FOOD_HSV_UPPER = np.array([20, 255, 255])
+FOOD_KERNEL = np.ones((3, 3), np.uint8)
+
+# Contour area limits in camera pixels
+FISH_AREA_MIN, FISH_AREA_MAX = 500, 5000
+FOOD_AREA_MIN, FOOD_AREA_MAX = 10, 200
+FOOD_LUT_BITS = 6  # Bits per channel of the BGR food-colour lookup table (64^3 = 256 KB)
+
 # Feeding parameters
 FEED_AMOUNT_GRAMS = 5.0
 FEEDING_DURATION = 300  # 5 minutes
@@ -91,6 +165,106 @@ CONFIG_FILE = "config.yaml"
 LOG_FILE = "feeding_monitor.log"
 DATABASE_FILE = "feeding_data.db"
 MODEL_PATH = "models/yolov5s.pt"
+ONNX_MODEL_PATH = "models/yolov5s.onnx"
+ONNX_INT8_MODEL_PATH = "models/yolov5s_int8.onnx"
+TFLITE_INT8_MODEL_PATH = "models/yolov5s_int8.tflite"
+XNNPACK_DELEGATE = "libxnnpack_delegate.so"
+YOLO_INPUT_SIZE = 640   # Input size assumed when an ONNX model's input shape is dynamic
+YOLO_NMS_THRESHOLD = 0.45
+YOLO_PAD_VALUE = 114    # Letterbox border grey used by the YOLOv5 exporter
+
+def _fish_filter(areas, widths, heights, area_scale):
+    """Keep contours of fish size (camera pixels) with a fish-like aspect ratio."""
+    scaled = areas * area_scale
+    aspect = widths / np.maximum(heights, 1.0)
+    
+    # Fish typically have aspect ratio between 1.5 and 4
+    return (scaled > FISH_AREA_MIN) & (scaled < FISH_AREA_MAX) & (aspect > 1.5) & (aspect < 4)
+
+def _food_filter(areas, perimeters, area_scale):
+    """Keep pellet-sized (camera pixels), roughly circular contours.
+    Returns the keep mask and the circularity of every contour."""
+    scaled = areas * area_scale
+    circularity = 4 * np.pi * areas / np.maximum(perimeters * perimeters, 1e-9)
+    keep = (scaled > FOOD_AREA_MIN) & (scaled < FOOD_AREA_MAX) & (perimeters > 0) & (circularity > 0.5)
+    return keep, circularity
+
+def _build_food_lut():
+    """Classify every quantised BGR colour against the food HSV range.
+    A cell counts as food when most of the 24-bit colours it covers are in range."""
+    side = 1 << FOOD_LUT_BITS
+    step = 256 // side
+    g, r = np.mgrid[0:256, 0:256].astype(np.uint8)
+    votes = np.zeros((side, side, side), np.uint32)
+    
+    for b in range(256):
+        bgr = np.dstack([np.full_like(g, b), g, r])
+        mask = cv2.inRange(cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV), FOOD_HSV_LOWER, FOOD_HSV_UPPER)
+        votes[b // step] += (mask.reshape(side, step, side, step) // 255).sum(axis=(1, 3), dtype=np.uint32)
+    
+    return np.where(votes * 2 > step ** 3, 255, 0).astype(np.uint8).ravel()
+
+def _food_mask_lut(frame, lut, out):
+    """Food mask straight from a BGR frame with one table lookup per pixel."""
+    shift = 8 - FOOD_LUT_BITS
+    for y in range(frame.shape[0]):
+        for x in range(frame.shape[1]):
+            b = np.int32(frame[y, x, 0]) >> shift
+            g = np.int32(frame[y, x, 1]) >> shift
+            r = np.int32(frame[y, x, 2]) >> shift
+            out[y, x] = lut[(b << (2 * FOOD_LUT_BITS)) | (g << FOOD_LUT_BITS) | r]
+
+if numba is not None:
+    _fish_filter = numba.njit(cache=True)(_fish_filter)
+    _food_filter = numba.njit(cache=True)(_food_filter)
+    _food_mask_lut = numba.njit(cache=True)(_food_mask_lut)
+
+@dataclass
+class RTMsg:
+    """One real-time analysis message; field names are the published JSON keys."""
+    __slots__ = ('device_id', 'timestamp_ms', 'fish_count', 'food_count', 'strikes', 'motion_level')
+    device_id: str
+    timestamp_ms: int
+    fish_count: int
+    food_count: int
+    strikes: int
+    motion_level: float
+
+class LatestSlot:
+    """Single-item hand-off between threads that only ever holds the newest item.
+    
+    An item not taken before the next put is replaced (counted in dropped), or
+    combined with the new one when a merge(old, new) function is given.
+    close() wakes every waiting consumer.
+    """
+    
+    def __init__(self, merge=None):
+        self._cond = threading.Condition()
+        self._item = None
+        self._merge = merge
+        self.closed = False
+        self.dropped = 0
+    
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+                if self._merge is not None:
+                    item = self._merge(self._item, item)
+            self._item = item
+            self._cond.notify()
+    
+    def get(self, timeout=None):
+        """Take the newest item, waiting up to timeout seconds; None if none arrived."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self.closed, timeout)
+            item, self._item = self._item, None
+            return item
+    
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
 
 class FeedingMonitor:
     def __init__(self, config_file=CONFIG_FILE):
@@ -105,24 +279,47 @@ class FeedingMonitor:
         # Initialize detection models
         self.setup_detection_models()
         
-        # Data structures
+        # Data structures; the histories are bounded, so extend() evicts the
+        # oldest entries in O(1) instead of growing
         self.feeding_events = deque(maxlen=1000)
         self.strike_events = deque(maxlen=10000)
+        self.strike_total = 0          # Strikes ever appended to strike_events
+        self.session_strike_start = 0  # strike_total when the session started
         self.fish_positions = deque(maxlen=100)
         self.food_positions = deque(maxlen=100)
+        self._mqtt_outbox = []         # Feeding events awaiting the next batch publish
+        self._outbox_lock = threading.Lock()
+        self._pub_buf = []             # Real-time results awaiting the next batch publish
+        self._pub_lock = threading.Lock()
+        self._pub_last_flush = time.monotonic()
         
         # State variables
         self.feeding_active = False
         self.ir_illumination = False
         self.system_health = True
         self.last_feeding_time = None
+        self._session_t0 = None        # time.monotonic() at session start
+        self._frame_idx = 0            # Frames seen by analyze_frame
+        self._strike_pending = False   # Last analysed frame produced strikes
         self.background_model = None
         
         # Threading
-        self.frame_queue = queue.Queue(maxsize=10)
-        self.analysis_queue = queue.Queue(maxsize=100)
+        self.frame_slot = LatestSlot()
+        self.frame_requested = threading.Event()  # Set when the processor wants a frame
+        self.frame_requested.set()
+        self.analysis_slot = LatestSlot(merge=self.merge_results)
+        self.detect_lock = threading.Lock()  # Detector scratch buffers and MOG2 model
         self.running = True
         
+        # API uploads happen on a worker thread so callers never wait on the network
+        self._api_url = f"http://{API_SERVER}:{API_PORT}{API_ENDPOINT}"
+        self._api_headers = {"Content-Type": "application/json"}
+        self._api_payload_skel = {"pool_id": POOL_ID, "sensor_health": None}
+        self._api_queue = queue.Queue(maxsize=API_QUEUE_SIZE)
+        self._api_batch_supported = True
+        self._api_thread = threading.Thread(target=self.api_worker, name="api", daemon=True)
+        self._api_thread.start()
+        
         # Statistics
         self.session_stats = {
             'strikes': 0,
@@ -150,6 +347,7 @@ class FeedingMonitor:
                 },
                 'detection': {
                     'fish_confidence': FISH_CONFIDENCE_THRESHOLD,
+                    'fish_classes': FISH_CLASS_IDS,
                     'food_confidence': FOOD_CONFIDENCE_THRESHOLD,
                     'motion_threshold': MOTION_THRESHOLD
                 },
@@ -191,9 +389,16 @@ class FeedingMonitor:
         GPIO.setup(MOTION_SENSOR_PIN, GPIO.IN)
         GPIO.setup(STATUS_LED_PIN, GPIO.OUT)
         
-        # Initialize servo
-        self.servo = GPIO.PWM(SERVO_PIN, 50)  # 50Hz
-        self.servo.start(0)
+        # Initialize servo; pigpio times the pulses in hardware when pigpiod is
+        # running, otherwise fall back to RPi.GPIO software PWM
+        self.pi = pigpio.pi() if pigpio is not None else None
+        if self.pi is not None and not self.pi.connected:
+            self.pi = None
+        if self.pi is None:
+            self.servo = GPIO.PWM(SERVO_PIN, 50)  # 50Hz
+            self.servo.start(0)
+        self._servo_timers = []
+        self._servo_lock = threading.Lock()  # Dispenses come from MQTT and session threads
         
         # Status LED on
         GPIO.output(STATUS_LED_PIN, GPIO.HIGH)
@@ -205,16 +410,27 @@ class FeedingMonitor:
         try:
             self.camera = Picamera2()
             
-            # Configure camera
+            # Configure camera. libcamera's "RGB888" is stored B, G, R in memory,
+            # i.e. exactly OpenCV's BGR layout, so frames need no conversion.
             camera_config = self.camera.create_preview_configuration(
                 main={"size": (self.config['camera']['width'], 
-                              self.config['camera']['height'])},
-                controls={"ExposureTime": self.config['camera']['exposure']}
+                              self.config['camera']['height']),
+                      "format": "RGB888"},
+                controls={"ExposureTime": self.config['camera']['exposure']},
+                # Capture is on demand: keep the minimum of buffers and always
+                # return a frame exposed after the request, never a queued one
+                buffer_count=2,
+                queue=False
             )
             
             self.camera.configure(camera_config)
             self.camera.start()
             
+            # Motion and contour fish detection run on a downscaled copy; their
+            # results are scaled back up
+            self.detect_scale = self.config['camera']['width'] / DETECT_WIDTH
+            self.detect_size = (DETECT_WIDTH, round(self.config['camera']['height'] / self.detect_scale))
+            
             # Allow camera to warm up
             time.sleep(2)
             
@@ -235,6 +451,11 @@ class FeedingMonitor:
         self.mqtt_client.on_connect = self.on_mqtt_connect
         self.mqtt_client.on_message = self.on_mqtt_message
         
+        # Pipeline QoS 1 acknowledgements instead of waiting on each PUBACK,
+        # and bound what is buffered while the broker is unreachable
+        self.mqtt_client.max_inflight_messages_set(20)
+        self.mqtt_client.max_queued_messages_set(256)
+        
         try:
             self.mqtt_client.connect(
                 self.config['mqtt']['broker'],
@@ -250,6 +471,12 @@ class FeedingMonitor:
         """Initialize SQLite database."""
         self.db_conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
         self.db_cursor = self.db_conn.cursor()
+        self.db_lock = threading.Lock()  # The connection is shared with the API worker
+        
+        # WAL with NORMAL sync avoids an fsync per commit
+        self.db_cursor.execute("PRAGMA journal_mode=WAL")
+        self.db_cursor.execute("PRAGMA synchronous=NORMAL")
+        self.db_cursor.execute("PRAGMA temp_store=MEMORY")
         
         # Create tables
         self.db_cursor.execute('''
@@ -281,6 +508,15 @@ class FeedingMonitor:
             )
         ''')
         
+        # API payloads the server rejected or never received, retried later
+        self.db_cursor.execute('''
+            CREATE TABLE IF NOT EXISTS api_dead_letter (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL,
+                payload BLOB
+            )
+        ''')
+        
         self.db_conn.commit()
         self.logger.info("Database initialized")
     
@@ -291,24 +527,75 @@ class FeedingMonitor:
             self.background_subtractor = cv2.createBackgroundSubtractorMOG2(
                 history=500,
                 varThreshold=50,
-                detectShadows=True
+                detectShadows=False
             )
             
-            # Initialize optical flow
-            self.optical_flow = cv2.DISOpticalFlow_create()
+            # Scratch buffers reused by the detectors on every frame
+            shape = (self.detect_size[1], self.detect_size[0])
+            self._gray = np.empty(shape, np.uint8)
+            self._blurred = np.empty(shape, np.uint8)
+            self._thresh = np.empty(shape, np.uint8)
+            
+            # Pellets are only a few pixels across even at camera resolution, so
+            # food is detected on the full-resolution frame, cropped to the
+            # feeding zone given in camera pixels as [x0, y0, x1, y1] under
+            # detection.feeding_zone (whole frame if unset)
+            camera_shape = (self.config['camera']['height'], self.config['camera']['width'])
+            zone = self.config['detection'].get('feeding_zone')
+            if zone:
+                x0, y0, x1, y1 = zone
+                self.food_slice = (slice(y0, y1), slice(x0, x1))
+                self.food_origin = (x0, y0)
+            else:
+                self.food_slice = (slice(None), slice(None))
+                self.food_origin = (0, 0)
+            zone_shape = (len(range(*self.food_slice[0].indices(camera_shape[0]))),
+                          len(range(*self.food_slice[1].indices(camera_shape[1]))))
+            self._hsv = np.empty(zone_shape + (3,), np.uint8)
+            self._food_mask = np.empty(zone_shape, np.uint8)
+            self._morph = np.empty(zone_shape, np.uint8)
+            
+            # With numba the food mask is a single table lookup on the BGR frame,
+            # which replaces both the HSV conversion and inRange
+            self.food_lut = _build_food_lut() if numba is not None else None
             
-            # Initialize contour detector
-            self.contour_detector = cv2.SimpleBlobDetector_create()
+            # Motion is measured only inside the pond ROI, given in camera pixels
+            # as [x0, y0, x1, y1] under detection.roi (whole frame if unset)
+            roi = self.config['detection'].get('roi')
+            if roi:
+                x0, y0, x1, y1 = (round(v / self.detect_scale) for v in roi)
+                self.roi_slice = (slice(y0, y1), slice(x0, x1))
+            else:
+                self.roi_slice = (slice(None), slice(None))
+            roi_h = len(range(*self.roi_slice[0].indices(shape[0])))
+            roi_w = len(range(*self.roi_slice[1].indices(shape[1])))
+            self._motion_gray = np.empty((roi_h // 2, roi_w // 2), np.uint8)
+            self._fg_mask = np.empty_like(self._motion_gray)
             
-            # Load pre-trained models if available
-            if os.path.exists(MODEL_PATH):
-                self.logger.info("Loading YOLOv5 model...")
-                # import torch
-                # self.yolo_model = torch.hub.load('ultralytics/yolov5', 'custom', path=MODEL_PATH)
-                self.yolo_model = None  # Placeholder for actual model
+            # Load pre-trained models if available, preferring int8 exports
+            self.yolo_model = None
+            self.yolo_backend = None
+            self.fish_classes = np.asarray(self.config['detection'].get('fish_classes', FISH_CLASS_IDS))
+            if Interpreter is not None and os.path.exists(TFLITE_INT8_MODEL_PATH):
+                self.logger.info("Loading YOLOv5 int8 TFLite model...")
+                self.setup_yolo_tflite(TFLITE_INT8_MODEL_PATH)
+            elif ort is not None and os.path.exists(ONNX_INT8_MODEL_PATH):
+                self.logger.info("Loading YOLOv5 int8 ONNX model...")
+                self.setup_yolo_onnx(ONNX_INT8_MODEL_PATH)
+            elif ort is not None and os.path.exists(ONNX_MODEL_PATH):
+                self.logger.info("Loading YOLOv5 ONNX model...")
+                self.setup_yolo_onnx(ONNX_MODEL_PATH)
+            elif os.path.exists(MODEL_PATH):
+                self.logger.warning(
+                    f"Only PyTorch model found at {MODEL_PATH}; export it to "
+                    f"{ONNX_MODEL_PATH} for on-device inference. Using basic detection"
+                )
             else:
                 self.logger.warning("YOLOv5 model not found, using basic detection")
-                self.yolo_model = None
+            
+            if self.yolo_model is not None:
+                self.setup_yolo_letterbox((self.config['camera']['width'],
+                                           self.config['camera']['height']))
             
             self.logger.info("Detection models initialized")
             
@@ -316,6 +603,67 @@ class FeedingMonitor:
             self.logger.error(f"Model initialization failed: {e}")
             self.yolo_model = None
     
+    def setup_yolo_onnx(self, model_path):
+        """Create an ONNX Runtime session and bind preallocated input/output buffers."""
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = os.cpu_count()
+        
+        self.yolo_model = ort.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        
+        # Input is NCHW; dynamic dimensions come back as names rather than ints
+        model_input = self.yolo_model.get_inputs()[0]
+        height, width = model_input.shape[2:]
+        self.yolo_input_hw = (height if isinstance(height, int) else YOLO_INPUT_SIZE,
+                              width if isinstance(width, int) else YOLO_INPUT_SIZE)
+        
+        # The input buffer is reused for every frame, so it is bound only once
+        self.yolo_input = np.empty((1, 3) + self.yolo_input_hw, dtype=np.float32)
+        self.yolo_binding = self.yolo_model.io_binding()
+        self.yolo_binding.bind_cpu_input(model_input.name, self.yolo_input)
+        self.yolo_binding.bind_output(self.yolo_model.get_outputs()[0].name)
+        self.yolo_backend = 'onnx'
+    
+    def setup_yolo_tflite(self, model_path):
+        """Create a TFLite interpreter, using the XNNPACK delegate when it can be loaded."""
+        try:
+            delegates = [load_delegate(XNNPACK_DELEGATE)]
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"XNNPACK delegate unavailable ({e}), using built-in kernels")
+            delegates = []
+        
+        self.yolo_model = Interpreter(
+            model_path=model_path, num_threads=4, experimental_delegates=delegates
+        )
+        self.yolo_model.allocate_tensors()
+        self.yolo_input_details = self.yolo_model.get_input_details()[0]
+        self.yolo_output_details = self.yolo_model.get_output_details()[0]
+        self.yolo_input = np.empty(self.yolo_input_details['shape'], dtype=np.float32)
+        self.yolo_input_hw = tuple(int(v) for v in self.yolo_input_details['shape'][1:3])  # NHWC
+        
+        # Integer models get the float input quantized into their own buffer
+        input_dtype = self.yolo_input_details['dtype']
+        if input_dtype != np.float32:
+            self.yolo_quant_input = np.empty(self.yolo_input_details['shape'], dtype=input_dtype)
+            self.yolo_quant_range = (np.iinfo(input_dtype).min, np.iinfo(input_dtype).max)
+        self.yolo_backend = 'tflite'
+    
+    def setup_yolo_letterbox(self, frame_size):
+        """Precompute the aspect-preserving resize and padding from frame_size
+        (width, height) to the model input, as the YOLOv5 exporter expects."""
+        in_h, in_w = self.yolo_input_hw
+        ratio = min(in_w / frame_size[0], in_h / frame_size[1])
+        new_w, new_h = round(frame_size[0] * ratio), round(frame_size[1] * ratio)
+        pad_x, pad_y = (in_w - new_w) // 2, (in_h - new_h) // 2
+        
+        self.yolo_ratio = ratio
+        self.yolo_pad = (pad_x, pad_y)
+        self.yolo_border = (pad_y, in_h - new_h - pad_y, pad_x, in_w - new_w - pad_x)
+        self._yolo_resized = np.empty((new_h, new_w, 3), np.uint8)
+        self._yolo_frame = np.empty((in_h, in_w, 3), np.uint8)
+    
     def on_mqtt_connect(self, client, userdata, flags, rc):
         """MQTT connection callback."""
         if rc == 0:
@@ -329,7 +677,7 @@ class FeedingMonitor:
     def on_mqtt_message(self, client, userdata, msg):
         """MQTT message callback."""
         try:
-            message = json.loads(msg.payload.decode())
+            message = _loads(msg.payload)
             command = message.get('command', '')
             
             if command == 'start_feeding':
@@ -352,27 +700,28 @@ class FeedingMonitor:
         
         while self.running:
             try:
-                # Capture frame
+                # Only capture once the processor is ready, so no frame waits
+                if not self.frame_requested.wait(timeout=1.0) or not self.running:
+                    continue
+                self.frame_requested.clear()
+                
+                # Capture frame (already BGR, see setup_camera)
                 frame = self.camera.capture_array()
                 
-                # Convert to OpenCV format
-                if len(frame.shape) == 3:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                # Downscaled copy for motion and contour detection; food and YOLO
+                # use the full-resolution frame
+                small = cv2.resize(frame, self.detect_size, interpolation=cv2.INTER_AREA)
                 
-                # Add timestamp
-                timestamp = datetime.now()
+                # Add timestamp, also as epoch milliseconds for real-time publishing
+                now = time.time()
+                timestamp = datetime.fromtimestamp(now)
                 
-                # Put frame in queue (non-blocking)
-                try:
-                    self.frame_queue.put((frame, timestamp), timeout=0.1)
-                except queue.Full:
-                    # Skip frame if queue is full
-                    pass
-                
-                time.sleep(1.0 / self.config['camera']['fps'])
+                # Hand over the frame
+                self.frame_slot.put((frame, small, timestamp, int(now * 1000)))
                 
             except Exception as e:
                 self.logger.error(f"Frame capture error: {e}")
+                self.frame_requested.set()  # The processor is still waiting for a frame
                 time.sleep(1)
     
     def process_frames(self):
@@ -381,22 +730,39 @@ class FeedingMonitor:
         
         while self.running:
             try:
-                # Get frame from queue
-                frame, timestamp = self.frame_queue.get(timeout=1.0)
+                # Get the newest frame
+                item = self.frame_slot.get(timeout=1.0)
+                if item is None:
+                    continue
+                frame, small, timestamp, timestamp_ms = item
+                
+                # Let the next capture overlap with this frame's analysis
+                self.frame_requested.set()
                 
                 # Process frame
-                results = self.analyze_frame(frame, timestamp)
+                with self.detect_lock:
+                    results = self.analyze_frame(frame, small, timestamp)
+                results['timestamp_ms'] = timestamp_ms
                 
-                # Put results in analysis queue
-                self.analysis_queue.put(results)
+                # Hand results to the main loop
+                self.analysis_slot.put(results)
                 
-            except queue.Empty:
-                continue
             except Exception as e:
                 self.logger.error(f"Frame processing error: {e}")
     
-    def analyze_frame(self, frame, timestamp):
-        """Analyze single frame for fish and food detection."""
+    @staticmethod
+    def merge_results(old, new):
+        """Combine unconsumed analysis results into newer ones without losing strikes."""
+        if old['strikes']:
+            new['strikes'] = old['strikes'] + new['strikes']
+        return new
+    
+    def analyze_frame(self, frame, small, timestamp):
+        """Analyze single frame for fish and food detection.
+        
+        small is the frame downscaled to detect_size; all results are in
+        camera pixels.
+        """
         results = {
             'timestamp': timestamp,
             'fish_detected': [],
@@ -406,18 +772,26 @@ class FeedingMonitor:
         }
         
         try:
-            # Convert to different color spaces
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+            # Outside feeding sessions every other frame is enough
+            self._frame_idx += 1
+            if not self.feeding_active and self._frame_idx & 1:
+                return results
+            
+            gray, hsv = self.prepare_planes(frame, small)
             
             # Background subtraction for motion detection
             if self.background_subtractor is not None:
-                fg_mask = self.background_subtractor.apply(frame)
-                motion_level = cv2.countNonZero(fg_mask) / (frame.shape[0] * frame.shape[1])
-                results['motion_level'] = motion_level
+                fg_mask = self.motion_mask(gray)
+                moving = cv2.countNonZero(fg_mask)
+                results['motion_level'] = moving / fg_mask.size
+                
+                # A still scene with no strike in progress can't produce new detections
+                threshold = self.config['detection'].get('motion_threshold', MOTION_THRESHOLD)
+                if moving < threshold and not self._strike_pending:
+                    return results
             
             # Fish detection
-            fish_detections = self.detect_fish(frame, gray, hsv)
+            fish_detections = self.detect_fish(frame, small, gray)
             results['fish_detected'] = fish_detections
             
             # Food detection (only during feeding)
@@ -426,72 +800,211 @@ class FeedingMonitor:
                 results['food_detected'] = food_detections
                 
                 # Strike detection
-                strikes = self.detect_strikes(fish_detections, food_detections)
+                strikes = self.detect_strikes(fish_detections, food_detections, timestamp)
                 results['strikes'] = strikes
             
+            self._strike_pending = bool(results['strikes'])
             return results
             
         except Exception as e:
             self.logger.error(f"Frame analysis error: {e}")
             return results
     
-    def detect_fish(self, frame, gray, hsv):
-        """Detect fish in the frame."""
+    def prepare_planes(self, frame, small):
+        """Convert the frame once into the planes this iteration needs.
+        
+        Grayscale of the downscaled frame feeds MOG2 and the contour detector
+        (YOLO works on BGR). HSV of the full-resolution feeding zone is only
+        needed for food detection while feeding, and then only when the food
+        colour lookup table isn't available. Both are written into scratch
+        buffers; planes that aren't needed come back as None.
+        """
+        gray = hsv = None
+        if self.background_subtractor is not None or self.yolo_model is None:
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        if self.feeding_active and self.food_lut is None:
+            hsv = cv2.cvtColor(frame[self.food_slice], cv2.COLOR_BGR2HSV, dst=self._hsv)
+        
+        return gray, hsv
+    
+    def motion_mask(self, gray):
+        """Foreground mask from MOG2 run on a half-scale crop of the pond ROI."""
+        small_gray = self._motion_gray
+        cv2.resize(
+            gray[self.roi_slice], small_gray.shape[::-1], dst=small_gray,
+            interpolation=cv2.INTER_AREA
+        )
+        return self.background_subtractor.apply(small_gray, fgmask=self._fg_mask)
+    
+    def scale_detections(self, detections):
+        """Map detections from the downscaled frame back to camera resolution."""
+        scale = self.detect_scale
+        for detection in detections:
+            detection['x'] = int(detection['x'] * scale)
+            detection['y'] = int(detection['y'] * scale)
+            detection['width'] = int(detection['width'] * scale)
+            detection['height'] = int(detection['height'] * scale)
+            detection['area'] = detection['area'] * scale * scale
+        
+        return detections
+    
+    def detect_fish(self, frame, small, gray=None):
+        """Detect fish in the frame, in camera pixels.
+        
+        YOLO gets the full-resolution frame; the contour fallback works on the
+        downscaled one, deriving gray from it when not supplied.
+        """
         fish_detections = []
         
         try:
             # Use YOLO model if available
             if self.yolo_model is not None:
-                # YOLOv5 detection (placeholder)
-                # results = self.yolo_model(frame)
-                # fish_detections = self.parse_yolo_results(results, 'fish')
-                pass
+                fish_detections = self.detect_fish_yolo(frame)
             else:
                 # Basic contour-based detection
-                fish_detections = self.detect_fish_contours(frame, gray, hsv)
+                if gray is None:
+                    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+                fish_detections = self.scale_detections(self.detect_fish_contours(small, gray, None))
             
         except Exception as e:
             self.logger.error(f"Fish detection error: {e}")
         
         return fish_detections
     
+    def detect_fish_yolo(self, frame):
+        """Detect fish with the YOLOv5 model."""
+        # Letterbox: scale without distortion, then pad to the model input
+        resized = cv2.resize(frame, self._yolo_resized.shape[1::-1], dst=self._yolo_resized)
+        top, bottom, left, right = self.yolo_border
+        boxed = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                                   dst=self._yolo_frame, value=(YOLO_PAD_VALUE,) * 3)
+        rgb = boxed[:, :, ::-1]
+        
+        if self.yolo_backend == 'tflite':
+            output = self.run_yolo_tflite(rgb)
+        else:
+            # HWC->CHW and scale to [0, 1] straight into the bound input
+            np.divide(rgb.transpose(2, 0, 1), 255.0, out=self.yolo_input[0])
+            self.yolo_model.run_with_iobinding(self.yolo_binding)
+            output = self.yolo_binding.copy_outputs_to_cpu()[0]
+        
+        return self.parse_yolo_results(output)
+    
+    def run_yolo_tflite(self, rgb):
+        """Run the TFLite model on an RGB image, returning float YOLOv5 output."""
+        input_details = self.yolo_input_details
+        output_details = self.yolo_output_details
+        
+        # TFLite exports are NHWC; quantize the input if the model expects integers
+        np.divide(rgb, 255.0, out=self.yolo_input[0])
+        if input_details['dtype'] == np.float32:
+            tensor = self.yolo_input
+        else:
+            # Round to nearest and saturate; a bare cast truncates and wraps around
+            scale, zero_point = input_details['quantization']
+            quantized = self.yolo_input
+            np.divide(quantized, scale, out=quantized)
+            np.add(quantized, zero_point, out=quantized)
+            np.rint(quantized, out=quantized)
+            np.clip(quantized, *self.yolo_quant_range, out=quantized)
+            tensor = self.yolo_quant_input
+            np.copyto(tensor, quantized, casting='unsafe')
+        
+        self.yolo_model.set_tensor(input_details['index'], tensor)
+        self.yolo_model.invoke()
+        output = self.yolo_model.get_tensor(output_details['index'])
+        
+        if output_details['dtype'] != np.float32:
+            scale, zero_point = output_details['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        
+        # TFLite exports report boxes normalised to [0, 1]
+        height, width = self.yolo_input_hw
+        output = output.copy()
+        output[..., 0:4:2] *= width
+        output[..., 1:4:2] *= height
+        return output
+    
+    def parse_yolo_results(self, output):
+        """Convert raw YOLOv5 output (1, N, 5 + classes) into detection dicts."""
+        predictions = output[0]
+        
+        # Only rows whose most likely class is a fish class, scored by that class
+        class_ids = predictions[:, 5:].argmax(axis=1)
+        scores = predictions[:, 4] * predictions[np.arange(len(predictions)), 5 + class_ids]
+        keep = (np.isin(class_ids, self.fish_classes) &
+                (scores > self.config['detection']['fish_confidence']))
+        predictions, scores = predictions[keep], scores[keep]
+        
+        # Boxes come back as centre/size in letterboxed model input pixels
+        pad_x, pad_y = self.yolo_pad
+        cx = (predictions[:, 0] - pad_x) / self.yolo_ratio
+        cy = (predictions[:, 1] - pad_y) / self.yolo_ratio
+        w = predictions[:, 2] / self.yolo_ratio
+        h = predictions[:, 3] / self.yolo_ratio
+        
+        boxes = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1).tolist()
+        indices = cv2.dnn.NMSBoxes(
+            boxes, scores.tolist(), self.config['detection']['fish_confidence'], YOLO_NMS_THRESHOLD
+        )
+        
+        fish_detections = []
+        for i in np.array(indices).flatten():
+            fish_detections.append({
+                'x': int(cx[i]),
+                'y': int(cy[i]),
+                'width': int(w[i]),
+                'height': int(h[i]),
+                'area': float(w[i] * h[i]),
+                'confidence': float(scores[i])
+            })
+        
+        return fish_detections
+    
     def detect_fish_contours(self, frame, gray, hsv):
         """Detect fish using contour analysis."""
         fish_detections = []
         
         try:
             # Apply Gaussian blur
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+            cv2.GaussianBlur(gray, (5, 5), 0, dst=self._blurred)
             
             # Adaptive thresholding
-            thresh = cv2.adaptiveThreshold(
-                blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 11, 2
+            cv2.adaptiveThreshold(
+                self._blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+                cv2.THRESH_BINARY, 11, 2, dst=self._thresh
             )
             
             # Find contours
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            contours, _ = cv2.findContours(self._thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                return fish_detections
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                
-                # Filter by area (fish size)
-                if 500 < area < 5000:  # Adjust based on fish size
-                    x, y, w, h = cv2.boundingRect(contour)
-                    
-                    # Calculate aspect ratio
-                    aspect_ratio = w / h
-                    
-                    # Fish typically have aspect ratio between 1.5 and 4
-                    if 1.5 < aspect_ratio < 4:
-                        fish_detections.append({
-                            'x': x + w // 2,
-                            'y': y + h // 2,
-                            'width': w,
-                            'height': h,
-                            'area': area,
-                            'confidence': 0.7  # Fixed confidence for basic detection
-                        })
+            # Size check first so only plausible contours get measured further
+            area_scale = self.detect_scale ** 2
+            areas = np.fromiter((cv2.contourArea(c) for c in contours),
+                                dtype=np.float64, count=len(contours))
+            scaled = areas * area_scale
+            candidates = np.flatnonzero((scaled > FISH_AREA_MIN) & (scaled < FISH_AREA_MAX))
+            if candidates.size == 0:
+                return fish_detections
+            
+            # Pack the candidates' properties into arrays and filter them in one call
+            areas = areas[candidates]
+            boxes = np.array([cv2.boundingRect(contours[i]) for i in candidates], dtype=np.int32)
+            keep = _fish_filter(areas, boxes[:, 2].astype(np.float64),
+                                boxes[:, 3].astype(np.float64), area_scale)
+            
+            for i in np.flatnonzero(keep):
+                x, y, w, h = (int(v) for v in boxes[i])
+                fish_detections.append({
+                    'x': x + w // 2,
+                    'y': y + h // 2,
+                    'width': w,
+                    'height': h,
+                    'area': float(areas[i]),
+                    'confidence': 0.7  # Fixed confidence for basic detection
+                })
             
         except Exception as e:
             self.logger.error(f"Contour detection error: {e}")
@@ -499,80 +1012,84 @@ class FeedingMonitor:
         return fish_detections
     
     def detect_food(self, frame, gray, hsv):
-        """Detect food pellets in the frame."""
+        """Detect food pellets in the full-resolution feeding zone, in camera pixels."""
         food_detections = []
         
         try:
             # Food is typically small, circular, and different color
             # Use color-based detection
             
-            # Define food color range (adjust based on food type)
-            # Brown/tan food pellets
-            lower_brown = np.array([10, 50, 50])
-            upper_brown = np.array([20, 255, 255])
-            
             # Create mask for food color
-            mask = cv2.inRange(hsv, lower_brown, upper_brown)
+            if self.food_lut is not None:
+                _food_mask_lut(frame[self.food_slice], self.food_lut, self._food_mask)
+            else:
+                cv2.inRange(hsv, FOOD_HSV_LOWER, FOOD_HSV_UPPER, dst=self._food_mask)
             
-            # Morphological operations to clean up
-            kernel = np.ones((3, 3), np.uint8)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+            # Single opening pass to remove speckle noise
+            cv2.morphologyEx(self._food_mask, cv2.MORPH_OPEN, FOOD_KERNEL, dst=self._morph)
             
             # Find contours
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            contours, _ = cv2.findContours(self._morph, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                return food_detections
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                
-                # Filter by area (food pellet size)
-                if 10 < area < 200:  # Adjust based on pellet size
-                    x, y, w, h = cv2.boundingRect(contour)
-                    
-                    # Calculate circularity
-                    perimeter = cv2.arcLength(contour, True)
-                    if perimeter > 0:
-                        circularity = 4 * math.pi * area / (perimeter * perimeter)
-                        
-                        # Food pellets are typically circular
-                        if circularity > 0.5:
-                            food_detections.append({
-                                'x': x + w // 2,
-                                'y': y + h // 2,
-                                'width': w,
-                                'height': h,
-                                'area': area,
-                                'confidence': min(circularity, 1.0)
-                            })
+            # Size check first so only plausible contours get measured further
+            areas = np.fromiter((cv2.contourArea(c) for c in contours),
+                                dtype=np.float64, count=len(contours))
+            candidates = np.flatnonzero((areas > FOOD_AREA_MIN) & (areas < FOOD_AREA_MAX))
+            if candidates.size == 0:
+                return food_detections
+            
+            # Pack the candidates' properties into arrays and filter them in one call
+            areas = areas[candidates]
+            perimeters = np.fromiter((cv2.arcLength(contours[i], True) for i in candidates),
+                                     dtype=np.float64, count=candidates.size)
+            keep, circularity = _food_filter(areas, perimeters, 1.0)
+            
+            x0, y0 = self.food_origin
+            for i in np.flatnonzero(keep):
+                x, y, w, h = cv2.boundingRect(contours[candidates[i]])
+                food_detections.append({
+                    'x': x0 + x + w // 2,
+                    'y': y0 + y + h // 2,
+                    'width': w,
+                    'height': h,
+                    'area': float(areas[i]),
+                    'confidence': min(float(circularity[i]), 1.0)
+                })
             
         except Exception as e:
             self.logger.error(f"Food detection error: {e}")
         
         return food_detections
     
-    def detect_strikes(self, fish_detections, food_detections):
-        """Detect feeding strikes based on fish and food positions."""
+    def detect_strikes(self, fish_detections, food_detections, timestamp):
+        """Detect feeding strikes based on fish and food positions.
+        
+        Strikes are stamped with the capture timestamp of the frame they came from.
+        """
         strikes = []
         
         try:
-            # Check each fish against each food item
-            for fish in fish_detections:
-                for food in food_detections:
-                    # Calculate distance between fish and food
-                    dx = fish['x'] - food['x']
-                    dy = fish['y'] - food['y']
-                    distance = math.sqrt(dx * dx + dy * dy)
-                    
-                    # If fish is close to food, it might be a strike
-                    if distance < MAX_STRIKE_DISTANCE:
-                        strikes.append({
-                            'fish_x': fish['x'],
-                            'fish_y': fish['y'],
-                            'food_x': food['x'],
-                            'food_y': food['y'],
-                            'distance': distance,
-                            'timestamp': datetime.now()
-                        })
+            if not fish_detections or not food_detections:
+                return strikes
+            
+            # Distance between every fish and every food item in one broadcast
+            fish = np.array([(f['x'], f['y']) for f in fish_detections], dtype=np.float32)
+            food = np.array([(f['x'], f['y']) for f in food_detections], dtype=np.float32)
+            distances = np.hypot(fish[:, None, 0] - food[None, :, 0],
+                                 fish[:, None, 1] - food[None, :, 1])
+            
+            # If fish is close to food, it might be a strike
+            fish_idx, food_idx = np.nonzero(distances < MAX_STRIKE_DISTANCE)
+            strikes = [{
+                'fish_x': fish_detections[i]['x'],
+                'fish_y': fish_detections[i]['y'],
+                'food_x': food_detections[j]['x'],
+                'food_y': food_detections[j]['y'],
+                'distance': float(distances[i, j]),
+                'timestamp': timestamp
+            } for i, j in zip(fish_idx, food_idx)]
             
         except Exception as e:
             self.logger.error(f"Strike detection error: {e}")
@@ -588,6 +1105,8 @@ class FeedingMonitor:
         self.logger.info("Starting feeding session")
         self.feeding_active = True
         self.last_feeding_time = datetime.now()
+        self._session_t0 = time.monotonic()
+        self.session_strike_start = self.strike_total
         
         # Reset session statistics
         self.session_stats = {
@@ -607,8 +1126,10 @@ class FeedingMonitor:
             self.enable_ir_illumination()
         
         # Start analysis timer
-        threading.Timer(self.config['feeding']['duration_seconds'], 
-                       self.stop_feeding_session).start()
+        session_timer = threading.Timer(self.config['feeding']['duration_seconds'],
+                                        self.stop_feeding_session)
+        session_timer.daemon = True  # Must not hold the process open after shutdown
+        session_timer.start()
         
         # Publish feeding start event
         self.publish_feeding_event('start')
@@ -620,6 +1141,7 @@ class FeedingMonitor:
         
         self.logger.info("Stopping feeding session")
         self.feeding_active = False
+        self.flush_realtime()
         
         # Disable IR illumination
         self.disable_ir_illumination()
@@ -645,21 +1167,32 @@ class FeedingMonitor:
         
         self.logger.info(f"Feeding session completed: {self.session_stats}")
     
+    def set_servo(self, pulse_width):
+        """Drive the servo with a pulse width in microseconds (0 stops the pulses)."""
+        if self.pi is not None:
+            self.pi.set_servo_pulsewidth(SERVO_PIN, pulse_width)
+        else:
+            self.servo.ChangeDutyCycle(pulse_width * 100 / SERVO_PERIOD_US)
+    
     def dispense_food(self):
-        """Control servo to dispense food."""
+        """Control servo to dispense food without blocking the caller."""
         try:
-            # Rotate servo to dispense position
-            duty_cycle = 2.5 + (90 * 10) / 180  # 90 degrees
-            self.servo.ChangeDutyCycle(duty_cycle)
-            time.sleep(1)
-            
-            # Return to closed position
-            duty_cycle = 2.5  # 0 degrees
-            self.servo.ChangeDutyCycle(duty_cycle)
-            time.sleep(1)
-            
-            # Stop servo
-            self.servo.ChangeDutyCycle(0)
+            with self._servo_lock:
+                # A previous dispense's close/stop must not cut this one short
+                for timer in self._servo_timers:
+                    timer.cancel()
+                
+                # Rotate servo to dispense position
+                self.set_servo(SERVO_OPEN_US)
+                
+                # Return to closed position after 1s, then stop the servo after 2s
+                self._servo_timers = [
+                    threading.Timer(1.0, self.set_servo, (SERVO_CLOSED_US,)),
+                    threading.Timer(2.0, self.set_servo, (0,))
+                ]
+                for timer in self._servo_timers:
+                    timer.daemon = True
+                    timer.start()
             
             self.logger.info("Food dispensed")
             
@@ -690,19 +1223,15 @@ class FeedingMonitor:
         if not self.feeding_active:
             return
         
-        # Calculate duration
-        duration = (datetime.now() - self.last_feeding_time).total_seconds()
+        # Calculate duration on the monotonic clock so NTP steps can't skew it
+        duration = time.monotonic() - self._session_t0
         self.session_stats['feeding_duration'] = duration
         
         # Count strikes in the session
-        session_start = self.last_feeding_time
-        strikes_in_session = [
-            strike for strike in self.strike_events 
-            if strike['timestamp'] >= session_start
-        ]
-        self.session_stats['strikes'] = len(strikes_in_session)
+        self.session_stats['strikes'] = len(self.session_strikes())
         
         # Estimate fish count (maximum concurrent fish detected)
+        session_start = self.last_feeding_time
         max_fish_count = 0
         for event in self.feeding_events:
             if event['timestamp'] >= session_start:
@@ -717,68 +1246,91 @@ class FeedingMonitor:
                 self.session_stats['strikes'] / self.config['feeding']['amount_grams']
             )
     
+    def session_strikes(self):
+        """Strikes recorded since the current session started."""
+        # Strikes are appended in time order, so the session's strikes are the
+        # newest ones; the deque may have evicted the oldest of them
+        count = min(self.strike_total - self.session_strike_start, len(self.strike_events))
+        return list(islice(self.strike_events, len(self.strike_events) - count, None))
+    
     def save_feeding_session(self):
         """Save feeding session to database."""
         try:
-            self.db_cursor.execute('''
-                INSERT INTO feeding_sessions 
-                (timestamp, duration_seconds, strikes_count, fish_count, 
-                 food_amount_grams, efficiency_percent, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                self.last_feeding_time,
-                self.session_stats['feeding_duration'],
-                self.session_stats['strikes'],
-                self.session_stats['fish_count'],
-                self.config['feeding']['amount_grams'],
-                self.session_stats['efficiency'],
-                f"IR: {self.ir_illumination}"
-            ))
-            
-            session_id = self.db_cursor.lastrowid
-            
-            # Save individual strikes
-            session_start = self.last_feeding_time
-            for strike in self.strike_events:
-                if strike['timestamp'] >= session_start:
-                    self.db_cursor.execute('''
-                        INSERT INTO strike_events 
-                        (session_id, timestamp, fish_x, fish_y, food_x, food_y, 
-                         distance_pixels, duration_seconds)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        session_id,
-                        strike['timestamp'],
-                        strike['fish_x'],
-                        strike['fish_y'],
-                        strike['food_x'],
-                        strike['food_y'],
-                        strike['distance'],
-                        0.5  # Estimated strike duration
-                    ))
-            
-            self.db_conn.commit()
+            rows = [
+                (strike['timestamp'], strike['fish_x'], strike['fish_y'],
+                 strike['food_x'], strike['food_y'], strike['distance'],
+                 0.5)  # Estimated strike duration
+                for strike in self.session_strikes()
+            ]
+            
+            # Session and strikes are written in a single transaction
+            with self.db_lock, self.db_conn:
+                self.db_cursor.execute('''
+                    INSERT INTO feeding_sessions 
+                    (timestamp, duration_seconds, strikes_count, fish_count, 
+                     food_amount_grams, efficiency_percent, notes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    self.last_feeding_time,
+                    self.session_stats['feeding_duration'],
+                    self.session_stats['strikes'],
+                    self.session_stats['fish_count'],
+                    self.config['feeding']['amount_grams'],
+                    self.session_stats['efficiency'],
+                    f"IR: {self.ir_illumination}"
+                ))
+                
+                session_id = self.db_cursor.lastrowid
+                
+                # Save individual strikes
+                self.db_cursor.executemany('''
+                    INSERT INTO strike_events 
+                    (session_id, timestamp, fish_x, fish_y, food_x, food_y, 
+                     distance_pixels, duration_seconds)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(session_id,) + row for row in rows])
+            
             self.logger.info("Feeding session saved to database")
             
         except Exception as e:
             self.logger.error(f"Database save error: {e}")
     
     def publish_feeding_event(self, event_type):
-        """Publish feeding event via MQTT."""
+        """Queue a feeding event for the next batched MQTT publish."""
+        event = {
+            'device_id': DEVICE_ID,
+            'location': LOCATION_ID,
+            'timestamp': datetime.now().isoformat(),
+            'event_type': event_type,
+            'session_stats': dict(self.session_stats),
+            'config': self.config['feeding']
+        }
+        with self._outbox_lock:
+            self._mqtt_outbox.append(event)
+    
+    def publish_events(self):
+        """Flush queued feeding events every EVENT_FLUSH_INTERVAL seconds."""
+        while self.running:
+            time.sleep(EVENT_FLUSH_INTERVAL)
+            self.flush_events()
+    
+    def flush_events(self):
+        """Publish all queued feeding events as one {"events": [...]} message."""
+        # Called from the event thread and from shutdown; each event is taken once
+        with self._outbox_lock:
+            events, self._mqtt_outbox = self._mqtt_outbox, []
+        if not events:
+            return
+        
         try:
             topic = f"aquaticmonitoring/{LOCATION_ID}/feeding/events"
+            payload = _dumps({'events': events})
             
-            payload = {
-                'device_id': DEVICE_ID,
-                'location': LOCATION_ID,
-                'timestamp': datetime.now().isoformat(),
-                'event_type': event_type,
-                'session_stats': self.session_stats,
-                'config': self.config['feeding']
-            }
-            
-            self.mqtt_client.publish(topic, json.dumps(payload))
-            self.logger.info(f"Published feeding event: {event_type}")
+            self.mqtt_client.publish(topic, payload, qos=1)
+            self.logger.info(
+                f"Published {len(events)} feeding event(s): "
+                f"{', '.join(e['event_type'] for e in events)}"
+            )
             
         except Exception as e:
             self.logger.error(f"MQTT publish error: {e}")
@@ -796,13 +1348,13 @@ class FeedingMonitor:
                 'feeding_active': self.feeding_active,
                 'ir_illumination': self.ir_illumination,
                 'last_feeding': self.last_feeding_time.isoformat() if self.last_feeding_time else None,
-                'queue_sizes': {
-                    'frames': self.frame_queue.qsize(),
-                    'analysis': self.analysis_queue.qsize()
+                'dropped_frames': {
+                    'frames': self.frame_slot.dropped,
+                    'analysis': self.analysis_slot.dropped
                 }
             }
             
-            self.mqtt_client.publish(topic, json.dumps(payload), retain=True)
+            self.mqtt_client.publish(topic, _dumps(payload), retain=True)
             self.logger.info("Published system status")
             
         except Exception as e:
@@ -817,10 +1369,12 @@ class FeedingMonitor:
             self.logger.info("Calibrating background model...")
             for i in range(100):  # Collect 100 frames
                 frame = self.camera.capture_array()
-                if len(frame.shape) == 3:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
                 
-                self.background_subtractor.apply(frame)
+                # Train on the same input the analysis thread uses, between
+                # frames so its scratch buffers aren't overwritten mid-analysis
+                frame = cv2.resize(frame, self.detect_size, interpolation=cv2.INTER_AREA)
+                with self.detect_lock:
+                    self.motion_mask(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray))
                 time.sleep(0.1)
             
             # Test servo movement
@@ -839,111 +1393,271 @@ class FeedingMonitor:
             self.logger.error(f"Calibration error: {e}")
     
     def send_api_data(self, data):
-        """Send feeding data to REST API."""
-        try:
-            # Prepare API payload
-            payload = {
-                "timestamp": data.get("timestamp", int(time.time() * 1000)),
-                "feeding_duration_seconds": data.get("duration_seconds", 0),
-                "strikes_count": data.get("strikes_count", 0),
-                "fish_count": data.get("fish_count", 0),
-                "food_consumed_grams": data.get("food_consumed_grams", 0),
-                "feeding_efficiency": data.get("efficiency_percent", 0),
-                "water_temperature": data.get("water_temperature", 22.0),
-                "sensor_health": self.system_health,
-                "pool_id": POOL_ID
-            }
+        """Queue feeding data for the REST API worker."""
+        # Prepare API payload
+        payload = {
+            **self._api_payload_skel,
+            "timestamp": data.get("timestamp", int(time.time() * 1000)),
+            "feeding_duration_seconds": data.get("duration_seconds", 0),
+            "strikes_count": data.get("strikes_count", 0),
+            "fish_count": data.get("fish_count", 0),
+            "food_consumed_grams": data.get("food_consumed_grams", 0),
+            "feeding_efficiency": data.get("efficiency_percent", 0),
+            "water_temperature": data.get("water_temperature", 22.0),
+            "sensor_health": self.system_health
+        }
+        
+        self.put_api_queue(payload)
+    
+    def put_api_queue(self, item):
+        """Queue an item for the API worker, dropping the oldest rather than
+        blocking when the API is down."""
+        while True:
+            try:
+                self._api_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._api_queue.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    def api_worker(self):
+        """Post queued API payloads in the background, batching whatever is pending.
+        A None in the queue stops the worker once everything before it is sent."""
+        stopping = False
+        while not stopping:
+            # Block for the first payload, then give others a short window to join
+            batch = [self._api_queue.get()]
+            deadline = time.monotonic() + API_BATCH_WAIT
+            while len(batch) < API_BATCH_SIZE and batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._api_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
             
-            # Send POST request to API
-            url = f"http://{API_SERVER}:{API_PORT}{API_ENDPOINT}"
-            headers = {"Content-Type": "application/json"}
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            if not batch:
+                continue
             
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
+            sent = self.post_api_batch(batch)
+            if sent < len(batch):
+                self.dead_letter(batch[sent:])
+            elif not stopping:
+                self.replay_dead_letters()
+    
+    def flush_api_queue(self, wait=True):
+        """Stop the API worker after it has sent (or dead-lettered) everything queued."""
+        # Block for room rather than evicting a queued payload to fit the sentinel
+        try:
+            self._api_queue.put(None, timeout=API_STOP_TIMEOUT)
+        except queue.Full:
+            # The worker is stuck on the network; keep what it hasn't taken yet
+            pending = []
+            while True:
+                try:
+                    pending.append(self._api_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if pending:
+                self.dead_letter(pending)
+            return
+        if wait:
+            self._api_thread.join(timeout=30)
+    
+    def post_api_batch(self, payloads):
+        """POST payloads to the REST API, as one {"readings": [...]} batch when there
+        is more than one. Returns how many (from the front of the list) were accepted."""
+        start = time.monotonic()
+        try:
+            if len(payloads) > 1 and self._api_batch_supported:
+                response = SESSION.post(
+                    f"{self._api_url}/batch", data=_dumps({"readings": payloads}),
+                    headers=self._api_headers, timeout=10
+                )
+                
+                if response.status_code in (200, 201):
+                    self.logger.info(
+                        f"API batch sent: {len(payloads)} readings in "
+                        f"{(time.monotonic() - start) * 1000:.0f} ms"
+                    )
+                    return len(payloads)
+                elif response.status_code == 404:
+                    self.logger.warning("API batch endpoint not available, sending readings individually")
+                    self._api_batch_supported = False
+                else:
+                    self.logger.warning(f"API batch request failed: {response.status_code}")
+                    return 0
             
-            if response.status_code == 200:
-                self.logger.info(f"API data sent successfully: {response.status_code}")
-            else:
-                self.logger.warning(f"API request failed: {response.status_code}")
+            for sent, payload in enumerate(payloads):
+                response = SESSION.post(self._api_url, data=_dumps(payload), headers=self._api_headers, timeout=10)
                 
+                if response.status_code not in (200, 201):
+                    self.logger.warning(f"API request failed: {response.status_code}")
+                    return sent
+            
+            self.logger.info(
+                f"API data sent successfully: {len(payloads)} readings in "
+                f"{(time.monotonic() - start) * 1000:.0f} ms"
+            )
+            return len(payloads)
+            
         except requests.exceptions.RequestException as e:
             self.logger.error(f"API request error: {e}")
         except Exception as e:
             self.logger.error(f"Unexpected error sending API data: {e}")
+        return 0
+    
+    def dead_letter(self, payloads):
+        """Keep payloads the API didn't accept in SQLite for a later retry."""
+        try:
+            with self.db_lock, self.db_conn:
+                self.db_conn.executemany(
+                    "INSERT INTO api_dead_letter (created, payload) VALUES (?, ?)",
+                    [(time.time(), _dumps(payload)) for payload in payloads]
+                )
+            self.logger.warning(f"Stored {len(payloads)} unsent API readings for retry")
+            
+        except Exception as e:
+            self.logger.error(f"Dead-letter store error: {e}")
+    
+    def replay_dead_letters(self):
+        """Resend stored payloads, a batch at a time, while the API keeps accepting them."""
+        try:
+            while True:
+                with self.db_lock:
+                    rows = self.db_conn.execute(
+                        "SELECT id, payload FROM api_dead_letter ORDER BY id LIMIT ?", (API_BATCH_SIZE,)
+                    ).fetchall()
+                if not rows:
+                    return
+                
+                sent = self.post_api_batch([_loads(payload) for _, payload in rows])
+                with self.db_lock, self.db_conn:
+                    self.db_conn.executemany(
+                        "DELETE FROM api_dead_letter WHERE id = ?", [(row_id,) for row_id, _ in rows[:sent]]
+                    )
+                
+                if sent:
+                    self.logger.info(f"Replayed {sent} stored API readings")
+                if sent < len(rows):
+                    return
+            
+        except Exception as e:
+            self.logger.error(f"Dead-letter replay error: {e}")
     
     def run(self):
         """Main execution loop."""
         self.logger.info("Starting feeding monitor")
         
         try:
-            # Start background threads
-            frame_thread = threading.Thread(target=self.capture_frames)
-            process_thread = threading.Thread(target=self.process_frames)
+            # Start background threads. Detection stays in-process: MOG2 and
+            # strike detection need frames in order, and the heavy OpenCV and
+            # model kernels release the GIL and use every core themselves.
+            frame_thread = threading.Thread(target=self.capture_frames, name="capture")
+            process_thread = threading.Thread(target=self.process_frames, name="detection")
+            event_thread = threading.Thread(target=self.publish_events, name="mqtt-events", daemon=True)
             
             frame_thread.start()
             process_thread.start()
+            event_thread.start()
             
             # Main analysis loop
-            while self.running:
+            while self.running and not STOP.is_set():
                 try:
-                    # Get analysis results
-                    results = self.analysis_queue.get(timeout=1.0)
+                    # Get the newest analysis results
+                    results = self.analysis_slot.get(timeout=1.0)
+                    if results is None:
+                        continue
                     
                     # Update data structures
                     self.fish_positions.extend(results['fish_detected'])
                     self.food_positions.extend(results['food_detected'])
                     self.strike_events.extend(results['strikes'])
+                    self.strike_total += len(results['strikes'])
                     
                     # Publish real-time data
                     if self.feeding_active:
                         self.publish_realtime_data(results)
                     
-                except queue.Empty:
-                    continue
                 except Exception as e:
                     self.logger.error(f"Analysis loop error: {e}")
             
-            # Wait for threads to complete
+            # Stop the pipeline and wait for threads to complete
+            self._stop_pipeline()
             frame_thread.join()
             process_thread.join()
             
         except KeyboardInterrupt:
             self.logger.info("Shutting down...")
-            self.shutdown()
         except Exception as e:
             self.logger.error(f"Runtime error: {e}")
-            self.shutdown()
     
     def publish_realtime_data(self, results):
-        """Publish real-time analysis data."""
+        """Buffer real-time analysis data, publishing it in batches."""
+        payload = RTMsg(DEVICE_ID, results['timestamp_ms'], len(results['fish_detected']),
+                        len(results['food_detected']), len(results['strikes']),
+                        results['motion_level'])
+        
+        with self._pub_lock:
+            self._pub_buf.append(payload)
+            due = (len(self._pub_buf) >= REALTIME_BATCH_SIZE or
+                   time.monotonic() - self._pub_last_flush > REALTIME_BATCH_INTERVAL)
+        
+        if due:
+            self.flush_realtime()
+    
+    def flush_realtime(self):
+        """Publish buffered real-time results as one JSON list."""
+        with self._pub_lock:
+            batch, self._pub_buf = self._pub_buf, []
+            self._pub_last_flush = time.monotonic()
+        if not batch:
+            return
+        
         try:
-            topic = f"aquaticmonitoring/{LOCATION_ID}/feeding/realtime"
-            
-            payload = {
-                'device_id': DEVICE_ID,
-                'timestamp': results['timestamp'].isoformat(),
-                'fish_count': len(results['fish_detected']),
-                'food_count': len(results['food_detected']),
-                'strikes': len(results['strikes']),
-                'motion_level': results['motion_level']
-            }
-            
-            self.mqtt_client.publish(topic, json.dumps(payload))
+            topic = f"aquaticmonitoring/{LOCATION_ID}/feeding/realtime_batch"
+            # Best-effort telemetry: never wait on broker acknowledgements
+            self.mqtt_client.publish(topic, _dumps(batch), qos=0, retain=False)
             
         except Exception as e:
             self.logger.error(f"Real-time publish error: {e}")
     
+    def _stop_pipeline(self):
+        """Stop the capture and detection threads, waking any blocked waiting for work."""
+        self.running = False
+        self.frame_requested.set()
+        self.frame_slot.close()
+        self.analysis_slot.close()
+    
     def shutdown(self):
         """Shutdown the system gracefully."""
         self.logger.info("Shutting down feeding monitor")
         
-        self.running = False
+        self._stop_pipeline()
         
         # Stop feeding if active
         if self.feeding_active:
             self.stop_feeding_session()
         
+        # Send data still waiting in the batch buffers
+        self.flush_realtime()
+        self.flush_events()
+        self.flush_api_queue(wait=True)
+        
         # Cleanup GPIO
-        self.servo.stop()
+        for timer in self._servo_timers:
+            timer.cancel()
+        if self.pi is not None:
+            self.pi.set_servo_pulsewidth(SERVO_PIN, 0)
+            self.pi.stop()
+        else:
+            self.servo.stop()
         GPIO.cleanup()
         
         # Close camera
@@ -952,19 +1666,24 @@ class FeedingMonitor:
         
         # Close database
         if hasattr(self, 'db_conn'):
-            self.db_conn.close()
+            with self.db_lock:
+                self.db_conn.commit()
+                self.db_conn.close()
         
-        # Stop MQTT
+        # Stop MQTT; disconnecting first lets the network loop send queued publishes
         if hasattr(self, 'mqtt_client'):
-            self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
+            self.mqtt_client.loop_stop()
         
         self.logger.info("Shutdown complete")
 
+# Set by signal handlers; the main loop exits and main() runs the shutdown
+STOP = threading.Event()
+
 def signal_handler(signum, frame):
     """Handle shutdown signals."""
     print("\nShutdown signal received")
-    sys.exit(0)
+    STOP.set()
 
 def main():
     """Main entry point."""
@@ -984,7 +1703,10 @@ def main():
     
     # Create and run monitor
     monitor = FeedingMonitor(args.config)
-    monitor.run()
+    try:
+        monitor.run()
+    finally:
+        monitor.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -16,6 +16,8 @@ import argparse
 import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
 # API endpoint mappings
@@ -37,98 +39,96 @@ API_ENDPOINTS = {
     "fish_feeding_monitor": "/api/feeding-response-readings"
 }
 
-def update_arduino_config(file_path, server, port, pool_id):
-    """Update Arduino .ino files with API configuration"""
-    if not os.path.exists(file_path):
-        print(f"Warning: {file_path} not found")
-        return
-    
+def _compile_rules(rules):
+    """Combine (name, pattern, template) rules into one alternation regex, so a
+    file is scanned once, plus the replacement template for each named group"""
+    pattern = re.compile('|'.join(f'(?P<{name}>{regex})' for name, regex, _ in rules))
+    return pattern, {name: template for name, _, template in rules}
+
+def _flatten_endpoints(endpoints, prefix=""):
+    """Yield (name, endpoint) pairs, naming nested endpoints sensor.reading"""
+    for name, endpoint in endpoints.items():
+        if isinstance(endpoint, dict):
+            yield from _flatten_endpoints(endpoint, f"{prefix}{name}.")
+        else:
+            yield f"{prefix}{name}", endpoint
+
+SUMMARY_TEMPLATE = """# Aquatic Monitoring System - API Integration Configuration
+# Generated on: {generated}
+
+API_SERVER = "{server}"
+API_PORT = {port}
+POOL_ID = {pool}
+
+# All sensor modules have been configured to send data to:
+# {server}:{port}
+
+# API Endpoints:
+{endpoints}
+
+# Next Steps:
+# 1. Verify API server is running and accessible
+# 2. Upload firmware to ESP32 modules
+# 3. Run Python scripts for fish monitoring
+# 4. Monitor logs for successful API calls
+# 5. Check API dashboard for incoming data
+"""
+
+# Precompiled configuration patterns and their replacement templates
+_ARD_PATTERN, _ARD_TEMPLATES = _compile_rules([
+    ('server', r'const char\* api_server = "[^"]*";', 'const char* api_server = "{server}";'),
+    ('port', r'const int api_port = \d+;', 'const int api_port = {port};'),
+    ('pool', r'const int pool_id = \d+;', 'const int pool_id = {pool_id};'),
+    # Alternative patterns for different naming conventions
+    ('define_server', r'#define API_SERVER "[^"]*"', '#define API_SERVER "{server}"'),
+    ('define_port', r'#define API_PORT \d+', '#define API_PORT {port}'),
+    ('define_pool', r'#define POOL_ID \d+', '#define POOL_ID {pool_id}'),
+])
+
+_PY_PATTERN, _PY_TEMPLATES = _compile_rules([
+    ('server', r'self\.api_server = "[^"]*"', 'self.api_server = "{server}"'),
+    ('port', r'self\.api_port = \d+', 'self.api_port = {port}'),
+    ('pool', r'self\.pool_id = \d+', 'self.pool_id = {pool_id}'),
+])
+
+def _substitute(pattern, templates, content, server, port, pool_id):
+    """Apply every rule to content in a single pass"""
+    replacements = {
+        name: template.format(server=server, port=port, pool_id=pool_id)
+        for name, template in templates.items()
+    }
+    return pattern.sub(lambda match: replacements[match.lastgroup], content)
+
+def _update_file(file_path, pattern, templates, server, port, pool_id):
+    """Rewrite the API configuration values in one file; returns a status line"""
     try:
+        # Opening directly doubles as the existence check
         with open(file_path, 'r') as f:
             content = f.read()
         
-        # Update API server configuration
-        content = re.sub(
-            r'const char\* api_server = "[^"]*";',
-            f'const char* api_server = "{server}";',
-            content
-        )
+        new_content = _substitute(pattern, templates, content, server, port, pool_id)
         
-        content = re.sub(
-            r'const int api_port = \d+;',
-            f'const int api_port = {port};',
-            content
-        )
-        
-        content = re.sub(
-            r'const int pool_id = \d+;',
-            f'const int pool_id = {pool_id};',
-            content
-        )
-        
-        # Alternative patterns for different naming conventions
-        content = re.sub(
-            r'#define API_SERVER "[^"]*"',
-            f'#define API_SERVER "{server}"',
-            content
-        )
-        
-        content = re.sub(
-            r'#define API_PORT \d+',
-            f'#define API_PORT {port}',
-            content
-        )
-        
-        content = re.sub(
-            r'#define POOL_ID \d+',
-            f'#define POOL_ID {pool_id}',
-            content
-        )
+        # Leave already-configured files (and their mtimes) alone
+        if new_content == content:
+            return f"Unchanged: {file_path}"
         
         with open(file_path, 'w') as f:
-            f.write(content)
+            f.write(new_content)
         
-        print(f"Updated: {file_path}")
+        return f"Updated: {file_path}"
         
+    except FileNotFoundError:
+        return f"Warning: {file_path} not found"
     except Exception as e:
-        print(f"Error updating {file_path}: {e}")
+        return f"Error updating {file_path}: {e}"
+
+def update_arduino_config(file_path, server, port, pool_id):
+    """Update Arduino .ino files with API configuration; returns a status line"""
+    return _update_file(file_path, _ARD_PATTERN, _ARD_TEMPLATES, server, port, pool_id)
 
 def update_python_config(file_path, server, port, pool_id):
-    """Update Python files with API configuration"""
-    if not os.path.exists(file_path):
-        print(f"Warning: {file_path} not found")
-        return
-    
-    try:
-        with open(file_path, 'r') as f:
-            content = f.read()
-        
-        # Update API server configuration
-        content = re.sub(
-            r'self\.api_server = "[^"]*"',
-            f'self.api_server = "{server}"',
-            content
-        )
-        
-        content = re.sub(
-            r'self\.api_port = \d+',
-            f'self.api_port = {port}',
-            content
-        )
-        
-        content = re.sub(
-            r'self\.pool_id = \d+',
-            f'self.pool_id = {pool_id}',
-            content
-        )
-        
-        with open(file_path, 'w') as f:
-            f.write(content)
-        
-        print(f"Updated: {file_path}")
-        
-    except Exception as e:
-        print(f"Error updating {file_path}: {e}")
+    """Update Python files with API configuration; returns a status line"""
+    return _update_file(file_path, _PY_PATTERN, _PY_TEMPLATES, server, port, pool_id)
 
 def create_platformio_config(base_path, server, port, pool_id):
     """Create or update platformio.ini with API configuration"""
@@ -159,7 +159,16 @@ def test_api_connectivity(server, port):
     """Test if the API server is reachable"""
     try:
         import requests
-        response = requests.get(f"http://{server}:{port}/api/pools", timeout=5)
+        url = f"http://{server}:{port}/api/pools"
+        
+        # A HEAD probe is enough for liveness; fall back to a GET on the same
+        # connection (without downloading the body) if HEAD isn't implemented
+        with requests.Session() as session:
+            response = session.head(url, timeout=2, allow_redirects=False)
+            if response.status_code in (404, 405, 501):
+                response = session.get(url, timeout=2, stream=True)
+                response.close()
+        
         if response.status_code == 200:
             print(f"✓ API server is reachable at {server}:{port}")
             return True
@@ -217,49 +226,37 @@ def main():
         ("Fish_Feeding_Monitor/feeding_detection.py", "python"),
     ]
     
-    for config_file, file_type in sensor_configs:
-        file_path = base_dir / config_file
-        
-        if args.dry_run:
-            print(f"Would update: {file_path}")
-            continue
+    updaters = {"arduino": update_arduino_config, "python": update_python_config}
+    
+    if args.dry_run:
+        for config_file, _ in sensor_configs:
+            print(f"Would update: {base_dir / config_file}")
+    else:
+        # Files are independent, so update them concurrently and report in order
+        def update(entry):
+            config_file, file_type = entry
+            return updaters[file_type](base_dir / config_file, args.server, args.port, args.pool)
         
-        if file_type == "arduino":
-            update_arduino_config(file_path, args.server, args.port, args.pool)
-        elif file_type == "python":
-            update_python_config(file_path, args.server, args.port, args.pool)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for status in executor.map(update, sensor_configs):
+                print(status)
     
     if not args.dry_run:
         # Create/update platformio.ini
         create_platformio_config(base_dir, args.server, args.port, args.pool)
         
         # Create a configuration summary file
-        config_summary = f"""# Aquatic Monitoring System - API Integration Configuration
-# Generated on: {__import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-API_SERVER = "{args.server}"
-API_PORT = {args.port}
-POOL_ID = {args.pool}
-
-# All sensor modules have been configured to send data to:
-# {args.server}:{args.port}
-
-# API Endpoints:
-{chr(10).join(f"# {sensor}: {endpoint}" for sensor, endpoint in API_ENDPOINTS.items())}
-
-# Next Steps:
-# 1. Verify API server is running and accessible
-# 2. Upload firmware to ESP32 modules
-# 3. Run Python scripts for fish monitoring
-# 4. Monitor logs for successful API calls
-# 5. Check API dashboard for incoming data
-"""
-        
-        with open(base_dir / "api_config_summary.txt", 'w') as f:
-            f.write(config_summary)
+        summary_path = base_dir / "api_config_summary.txt"
+        summary_path.write_text(SUMMARY_TEMPLATE.format(
+            generated=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            server=args.server,
+            port=args.port,
+            pool=args.pool,
+            endpoints="\n".join(f"# {name}: {endpoint}" for name, endpoint in _flatten_endpoints(API_ENDPOINTS))
+        ))
         
         print(f"\nConfiguration complete!")
-        print(f"Summary saved to: {base_dir / 'api_config_summary.txt'}")
+        print(f"Summary saved to: {summary_path}")
         print(f"\nNext steps:")
         print(f"1. Upload firmware to your ESP32 modules")
         print(f"2. Run Python scripts for fish monitoring")